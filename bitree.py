@@ -1,3 +1,11 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
 class BinaryIndexedTree(object):
     def __init__(self, size=0):
         self.elems = [(0, 0) for i in xrange(size)]
@@ -59,12 +67,133 @@ class BinaryIndexedTree(object):
             idx -= (idx & -idx)
         return sum
 
+    def find_prefix(self, target):
+        ''' The first index whose sum reaches ''target'', assuming no value is
+        negative, or size + 1 if even the total falls short. O(log(n)). '''
+        pos = 0
+        step = 1
+        while step * 2 <= self.size:
+            step *= 2
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self._get_elem(nxt)[1] < target:
+                pos = nxt
+                target -= self._get_elem(nxt)[1]
+            step >>= 1
+        return pos + 1
+
     def display(self):
         print "size is %d" % self.size
         for i, v in enumerate(self.elems):
             print "%d: %s %d" % (i+1, v, self.sum(i+1))
 
 
+##
+# Array-backed variant: ''tree[i]'' holds the responsibility of index i (the
+# sum of values from i - 2^r + 1 to i) and ''vals[i]'' the value itself, both
+# 1 based with slot 0 unused. Both are array('l'), which keeps the scalar
+# methods about as fast as on a list and lets to_arrays() and from_arrays()
+# save and load the tree as it is. With NumPy, from_values() and sum_many()
+# work on ndarray views of them, over the whole array at once; without it they
+# fall back to scalar loops.
+#
+class ArrayBinaryIndexedTree(object):
+    def __init__(self, size=0):
+        self.size = size
+        self.tree = array('l', [0]) * (size + 1)
+        self.vals = array('l', [0]) * (size + 1)
+
+    @classmethod
+    def from_values(cls, values):
+        ''' Build a tree holding ''values'' (value i - 1 at index i) in O(n);
+        with NumPy, ''values'' may be an ndarray. '''
+        bt = cls(len(values))
+        n = bt.size
+        if numpy is not None:
+            vals = numpy.frombuffer(bt.vals, dtype=numpy.dtype(bt.vals.typecode))
+            vals[1:] = values
+            # The responsibility of i is prefix(i) - prefix(i - lowbit(i)).
+            prefix = numpy.cumsum(vals)
+            idx = numpy.arange(1, n + 1)
+            tree = numpy.frombuffer(bt.tree, dtype=numpy.dtype(bt.tree.typecode))
+            tree[1:] = prefix[idx] - prefix[idx - (idx & -idx)]
+        else:
+            bt.vals[1:] = array('l', values)
+            tree = bt.tree
+            tree[1:] = bt.vals[1:]
+            for i in xrange(1, n + 1):
+                j = i + (i & -i)
+                if j <= n:
+                    tree[j] += tree[i]
+        return bt
+
+    def update(self, idx, val):
+        ''' Set the value at ''idx'' (1 based) to ''val''. '''
+        self.add(idx, val - self.vals[idx])
+
+    def add(self, idx, change):
+        ''' Add ''change'' to the value at ''idx''. '''
+        self.vals[idx] += change
+        tree, n = self.tree, self.size
+        while idx <= n:
+            tree[idx] += change
+            idx += (idx & -idx)
+
+    def sum(self, idx):
+        ''' The sum at idx. '''
+        tree = self.tree
+        sum = 0
+        while idx > 0:
+            sum += tree[idx]
+            idx &= idx - 1
+        return int(sum)
+
+    def sum_many(self, indices):
+        ''' The sums at each of ''indices''. With NumPy this takes O(log(n))
+        vectorized steps over the whole batch and returns an int64 ndarray. '''
+        if numpy is None:
+            return [self.sum(idx) for idx in indices]
+        idx = numpy.array(indices, dtype=numpy.int64)
+        res = numpy.zeros(idx.shape, dtype=numpy.int64)
+        tree = numpy.frombuffer(self.tree, dtype=numpy.dtype(self.tree.typecode))
+        # tree[0] is 0, so indices that have reached 0 just keep adding 0.
+        while idx.any():
+            res += tree[idx]
+            idx &= idx - 1
+        return res
+
+    def find_prefix(self, target):
+        ''' The first index whose sum reaches ''target'', assuming no value is
+        negative, or size + 1 if even the total falls short. O(log(n)). '''
+        tree, n = self.tree, self.size
+        pos = 0
+        step = 1
+        while step * 2 <= n:
+            step *= 2
+        while step:
+            nxt = pos + step
+            if nxt <= n and tree[nxt] < target:
+                pos = nxt
+                target -= tree[nxt]
+            step >>= 1
+        return pos + 1
+
+    def to_arrays(self):
+        ''' The (tree, vals) arrays, e.g. for saving the tree. '''
+        return self.tree, self.vals
+
+    @classmethod
+    def from_arrays(cls, tree, vals):
+        ''' The tree that to_arrays() returned ''tree'' and ''vals'' for. The
+        arrays are used as they are, not copied. '''
+        if len(tree) != len(vals) or not tree:
+            raise ValueError("arrays do not fit a tree")
+        bt = cls(0)
+        bt.size = len(tree) - 1
+        bt.tree, bt.vals = tree, vals
+        return bt
+
+
 if __name__ == "__main__":
     import random
 
@@ -0,0 +1,209 @@
+##
+# Opt-in instrumentation for the schedulers and the trees.
+#
+# Nothing here runs unless a Stats is handed to a scheduler (see the ''stats''
+# argument of TaskScheduler in tasksched_fast.py and tasksched_hackrank.py).
+# instrument() then swaps the class of a tree object for a subclass whose
+# methods count and call the original ones, so trees that are not instrumented
+# run exactly the original code and pay nothing.
+#
+# Counters:
+#
+#   bitree.update, bitree.sum                   calls
+#   bitree.update_hops, bitree.sum_hops         indices walked by those calls
+#   segtree.add, segtree.query                  calls
+#   segtree.nodes                               nodes visited by all calls
+#   segtree.paths, segtree.path                 root to leaf walks, their levels
+#   segtree.copies                              nodes copied (persistent trees)
+#   valfunc.hit, valfunc.miss                   valfunc cache lookups (hackrank)
+#
+# plus a histogram of the time each insert took. Stats.to_dict() adds the
+# ratios derived from the counters and dump() writes it all as a line of JSON.
+# With ''sample_every'', such a line is also written every that many inserts,
+# so a run with both gives a JSON lines file whose last line is the total.
+#
+import json
+
+import segtree
+
+class Histogram(object):
+    ''' Latencies in power of two buckets of microseconds: bucket b counts
+    the latencies below 2^b us and at least 2^(b - 1) us. '''
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        b = int(seconds * 1e6).bit_length()
+        if b >= len(self.counts):
+            self.counts.extend([0] * (b + 1 - len(self.counts)))
+        self.counts[b] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        ''' The upper bound in microseconds of the bucket holding the ''q''
+        quantile (0..1). '''
+        rank = q * self.count
+        seen = 0
+        for b, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return 1 << b
+        return 0
+
+    def to_dict(self):
+        return {"count": self.count,
+                "mean_us": self.total / self.count * 1e6 if self.count else 0.0,
+                "p50_us": self.percentile(0.50),
+                "p99_us": self.percentile(0.99),
+                "max_us": self.max * 1e6,
+                "buckets": [[1 << b, n] for b, n in enumerate(self.counts) if n]}
+
+class Stats(object):
+    def __init__(self, sample_every=0, sample_stream=None):
+        self.counters = {}
+        self.latency = Histogram()
+        self.ninserts = 0
+        self.sample_every = sample_every
+        self.sample_stream = sample_stream
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def insert_done(self, seconds):
+        ''' Record an insert that took ''seconds'', and write a sample if one
+        is due. '''
+        self.ninserts += 1
+        self.latency.add(seconds)
+        if self.sample_every and self.ninserts % self.sample_every == 0:
+            self.dump(self.sample_stream)
+
+    def cached(self, func, cache):
+        ''' Wrap ''func'', whose results are memoized in ''cache'', to count
+        the cache hits and misses. '''
+        counters = self.counters
+        def wrapper(key):
+            name = "valfunc.hit" if key in cache else "valfunc.miss"
+            counters[name] = counters.get(name, 0) + 1
+            return func(key)
+        return wrapper
+
+    def _ratio(self, num, *dens):
+        den = sum(self.counters.get(d, 0) for d in dens)
+        return float(self.counters.get(num, 0)) / den if den else None
+
+    def to_dict(self):
+        derived = {
+            "bitree.update_hops_per_call": self._ratio("bitree.update_hops", "bitree.update"),
+            "bitree.sum_hops_per_call": self._ratio("bitree.sum_hops", "bitree.sum"),
+            "segtree.nodes_per_call": self._ratio("segtree.nodes", "segtree.add",
+                                                  "segtree.query"),
+            "segtree.mean_path": self._ratio("segtree.path", "segtree.paths"),
+            "valfunc.hit_ratio": self._ratio("valfunc.hit", "valfunc.hit", "valfunc.miss"),
+        }
+        return {"inserts": self.ninserts,
+                "counters": dict(self.counters),
+                "derived": dict((k, v) for k, v in derived.iteritems() if v is not None),
+                "insert_latency": self.latency.to_dict()}
+
+    def dump(self, stream):
+        stream.write(json.dumps(self.to_dict(), sort_keys=True) + "\n")
+
+
+##
+# Counting mixins. Each is combined with the class of the object being
+# instrumented, so the same mixin serves every tree with that interface (the
+# Binary Indexed Trees of bitree.py and tasksched_hackrank.py alike).
+#
+class _CountingBIT(object):
+    def update(self, idx, val):
+        self._count_update(idx)
+        self.stats.count("bitree.update")
+        return super(_CountingBIT, self).update(idx, val)
+
+    def _count_update(self, idx):
+        hops = 0
+        size = max(self.size, idx)
+        while 0 < idx <= size:
+            hops += 1
+            idx += (idx & -idx)
+        self.stats.count("bitree.update_hops", hops)
+
+    def sum(self, idx):
+        self.stats.count("bitree.sum")
+        self.stats.count("bitree.sum_hops", bin(idx).count("1") if idx > 0 else 0)
+        return super(_CountingBIT, self).sum(idx)
+
+class _CountingLazySEGTree(object):
+    def add(self, left, right, val):
+        self.stats.count("segtree.add")
+        return super(_CountingLazySEGTree, self).add(left, right, val)
+
+    def query(self, left, right):
+        self.stats.count("segtree.query")
+        return super(_CountingLazySEGTree, self).query(left, right)
+
+    def _apply(self, p, val):
+        self.stats.count("segtree.nodes")
+        return super(_CountingLazySEGTree, self)._apply(p, val)
+
+    def _walk(self, p):
+        levels = p.bit_length() - 1
+        self.stats.count("segtree.paths")
+        self.stats.count("segtree.path", levels)
+        self.stats.count("segtree.nodes", levels)
+
+    def _pull(self, p):
+        self._walk(p)
+        return super(_CountingLazySEGTree, self)._pull(p)
+
+    def _push(self, p):
+        self._walk(p)
+        return super(_CountingLazySEGTree, self)._push(p)
+
+class _CountingPersistentSEGTree(object):
+    def add(self, left, right, val, new_version=True):
+        self.stats.count("segtree.add")
+        self.stats.count("segtree.paths", 2)
+        self.stats.count("segtree.path", 2 * (self._cap.bit_length() - 1))
+        return super(_CountingPersistentSEGTree, self).add(left, right, val, new_version)
+
+    def query(self, left, right, version=None):
+        self.stats.count("segtree.query")
+        return super(_CountingPersistentSEGTree, self).query(left, right, version)
+
+    def _add(self, p, lo, hi, left, right, val):
+        self.stats.count("segtree.nodes")
+        return super(_CountingPersistentSEGTree, self)._add(p, lo, hi, left, right, val)
+
+    def _query(self, p, lo, hi, left, right):
+        self.stats.count("segtree.nodes")
+        return super(_CountingPersistentSEGTree, self)._query(p, lo, hi, left, right)
+
+    def _copy(self, p):
+        self.stats.count("segtree.copies")
+        return super(_CountingPersistentSEGTree, self)._copy(p)
+
+_classes = {}
+
+def instrument(obj, stats):
+    ''' Make the tree ''obj'' count its work into ''stats''. Returns ''obj''. '''
+    base = type(obj)
+    if base not in _classes:
+        if issubclass(base, segtree.PersistentSEGTree):
+            mixin = _CountingPersistentSEGTree
+        elif issubclass(base, segtree.LazySEGTree):
+            mixin = _CountingLazySEGTree
+        elif hasattr(base, "update") and hasattr(base, "sum"):
+            mixin = _CountingBIT
+        else:
+            raise TypeError("cannot instrument %s" % base.__name__)
+        _classes[base] = type("Counting" + base.__name__, (mixin, base), {})
+    obj.__class__ = _classes[base]
+    obj.stats = stats
+    return obj
@@ -1,3 +1,11 @@
+import heapq
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class SEGTreeNode(object):
     def __init__(self, leftchild, rightchild, index, valfunc):
         self.lc, self.rc = leftchild, rightchild
@@ -97,6 +105,366 @@ def _segtree_print(nodes):
 
 negative_infinity_func = lambda idx: float("-inf")
 
+
+##
+# Flat array-backed segment tree with lazy range-add and range-max.
+#
+# Node ''p'' has children ''2p'' and ''2p + 1''; leaves live at ''cap'' to
+# ''2cap - 1''. ''maxval[p]'' is the max of the subtree at ''p'' including every
+# add applied to ''p'' itself, but not the adds pending on its ancestors, which
+# are kept in ''lazy''. So the root always holds the true max, and a range add
+# only touches the O(log(n)) nodes covering the range plus their ancestors.
+# Both are typed arrays, so a tree can be saved and loaded as they are. The
+# padding leaves past ''size'' hold PERSISTENT_NEG: no add ever covers them, so
+# they stay there, far below any real value.
+#
+NEG_INF = float("-inf")
+PERSISTENT_NEG = -(1 << 62)
+
+class LazySEGTree(object):
+    def __init__(self, size):
+        ''' Create a tree with leaves 1 to ''size'', all at PERSISTENT_NEG
+        (i.e. far below any real value; build() fills them in). '''
+        cap = 1
+        while cap < size:
+            cap <<= 1
+        self.size = size
+        self._cap = cap
+        self._height = cap.bit_length() - 1
+        self.maxval = array('l', [PERSISTENT_NEG]) * (2 * cap)
+        self.lazy = array('l', [0]) * cap
+
+    @classmethod
+    def build(cls, values):
+        ''' Build a tree whose leaf i holds ''values[i - 1]'' in O(n): like
+        segtree_build_bottomup, each level is computed from the one below it,
+        but in place in the flat arrays, without recursion or node objects.
+        With NumPy, each level is a single vectorized maximum over the level
+        below, and ''values'' may be an ndarray. '''
+        tree = cls(len(values))
+        cap, maxval = tree._cap, tree.maxval
+        if numpy is not None:
+            m = numpy.frombuffer(maxval, dtype=numpy.dtype(maxval.typecode))
+            m[cap:cap + len(values)] = values
+            lo = cap
+            while lo > 1:
+                numpy.maximum(m[lo:2 * lo:2], m[lo + 1:2 * lo:2], out=m[lo // 2:lo])
+                lo //= 2
+            return tree
+        maxval[cap:cap + len(values)] = array('l', values)
+        for p in xrange(cap - 1, 0, -1):
+            lv, rv = maxval[2 * p], maxval[2 * p + 1]
+            maxval[p] = lv if lv > rv else rv
+        return tree
+
+    def _apply(self, p, val):
+        self.maxval[p] += val
+        if p < self._cap:
+            self.lazy[p] += val
+
+    def _pull(self, p):
+        ''' Recompute the ancestors of node ''p''. '''
+        maxval, lazy = self.maxval, self.lazy
+        while p > 1:
+            p >>= 1
+            lv, rv = maxval[2 * p], maxval[2 * p + 1]
+            maxval[p] = (lv if lv > rv else rv) + lazy[p]
+
+    def _push(self, p):
+        ''' Push pending adds down along the path from the root to node ''p''. '''
+        lazy = self.lazy
+        for s in xrange(self._height, 0, -1):
+            i = p >> s
+            if lazy[i]:
+                self._apply(2 * i, lazy[i])
+                self._apply(2 * i + 1, lazy[i])
+                lazy[i] = 0
+
+    def get(self, idx):
+        ''' The current value of the leaf with index ''idx''. '''
+        p = idx - 1 + self._cap
+        val = self.maxval[p]
+        p >>= 1
+        while p > 0:
+            val += self.lazy[p]
+            p >>= 1
+        return val
+
+    def add(self, left, right, val):
+        ''' Add ''val'' to leaves from ''left'' to ''right'', inclusively. '''
+        if left > right or val == 0:
+            return
+        l = left - 1 + self._cap
+        r = right + self._cap
+        l0, r0 = l, r - 1
+        while l < r:
+            if l & 1:
+                self._apply(l, val)
+                l += 1
+            if r & 1:
+                r -= 1
+                self._apply(r, val)
+            l >>= 1
+            r >>= 1
+        self._pull(l0)
+        self._pull(r0)
+
+    def add_suffix(self, idx, val):
+        ''' Add ''val'' to all leaves from ''idx'' to the end. '''
+        self.add(idx, self.size, val)
+
+    def max(self):
+        ''' The max over all leaves: O(1). '''
+        return self.maxval[1]
+
+    def query(self, left, right):
+        ''' The max over leaves from ''left'' to ''right'', inclusively. '''
+        if left > right:
+            return NEG_INF
+        l = left - 1 + self._cap
+        r = right + self._cap
+        self._push(l)
+        self._push(r - 1)
+        maxval = self.maxval
+        res = NEG_INF
+        while l < r:
+            if l & 1:
+                if maxval[l] > res:
+                    res = maxval[l]
+                l += 1
+            if r & 1:
+                r -= 1
+                if maxval[r] > res:
+                    res = maxval[r]
+            l >>= 1
+            r >>= 1
+        return res
+
+    def argmax(self):
+        ''' The index of a leaf holding the max (the leftmost one on ties). '''
+        maxval = self.maxval
+        p = 1
+        while p < self._cap:
+            p <<= 1
+            if maxval[p] < maxval[p + 1]:
+                p += 1
+        return p - self._cap + 1
+
+    def to_arrays(self):
+        ''' Copies of the (maxval, lazy) arrays, e.g. for saving the tree. '''
+        return self.maxval[:], self.lazy[:]
+
+    @classmethod
+    def from_arrays(cls, size, maxval, lazy):
+        ''' The tree with ''size'' leaves that to_arrays() returned ''maxval''
+        and ''lazy'' for. The arrays are used as they are, not copied. '''
+        tree = cls(0)
+        tree.size = size
+        tree._cap = len(lazy)
+        tree._height = tree._cap.bit_length() - 1
+        if len(maxval) != 2 * tree._cap or tree._cap < size:
+            raise ValueError("arrays do not fit a tree of %d leaves" % size)
+        tree.maxval, tree.lazy = maxval, lazy
+        return tree
+
+    def topk(self, k):
+        ''' The ''k'' largest leaves as (index, value) pairs, largest first:
+        a best-first descent with a heap over subtree maxima, O(k log(n)).
+        Padding leaves are left out. '''
+        maxval, lazy, cap = self.maxval, self.lazy, self._cap
+        res = []
+        if k <= 0 or self.size == 0:
+            return res
+        heap = [(-maxval[1], 1, 0)]  # (-value, node, adds pending above node)
+        while heap and len(res) < k:
+            negval, p, pending = heapq.heappop(heap)
+            if p >= cap:
+                res.append((p - cap + 1, -negval))
+                continue
+            pending += lazy[p]
+            for c in (2 * p, 2 * p + 1):
+                if maxval[c] != PERSISTENT_NEG:
+                    heapq.heappush(heap, (-(maxval[c] + pending), c, pending))
+        return res
+
+
+##
+# Persistent (path-copying) variant of LazySEGTree. Every range add creates a
+# new version and copies only the O(log(n)) nodes it touches; all older
+# versions stay queryable. Adds are never pushed down: ''tag[p]'' is what was
+# added to the whole subtree at ''p'', and ''maxval[p]'' includes it but not the
+# tags of its ancestors, so a leaf's value is its ''maxval'' plus the tags on
+# its path. Nodes live in flat typed arrays: version 0 is heap-indexed like
+# LazySEGTree (node 0 is unused and ''lc'' is 0 at leaves), and the nodes
+# copied by later versions are appended. Padding leaves hold PERSISTENT_NEG,
+# which stays far below any real value under adds.
+#
+
+class PersistentSEGTree(object):
+    def __init__(self, size):
+        ''' Create a tree with leaves 1 to ''size'', all at PERSISTENT_NEG. '''
+        cap = 1
+        while cap < size:
+            cap <<= 1
+        self.size = size
+        self._cap = cap
+        self.lc = array('i', [0]) * (2 * cap)
+        self.rc = array('i', [0]) * (2 * cap)
+        for p in xrange(1, cap):
+            self.lc[p], self.rc[p] = 2 * p, 2 * p + 1
+        self.maxval = array('l', [PERSISTENT_NEG]) * (2 * cap)
+        self.tag = array('l', [0]) * (2 * cap)
+        self.roots = array('i', [1])
+
+    @classmethod
+    def build(cls, values):
+        ''' Build version 0 with leaf i holding ''values[i - 1]'' in O(n);
+        with NumPy, ''values'' may be an ndarray. '''
+        tree = cls(len(values))
+        cap, maxval = tree._cap, tree.maxval
+        if numpy is not None:
+            m = numpy.frombuffer(maxval, dtype=numpy.dtype(maxval.typecode))
+            m[cap:cap + len(values)] = values
+        else:
+            maxval[cap:cap + len(values)] = array('l', values)
+        for p in xrange(cap - 1, 0, -1):
+            lv, rv = maxval[2 * p], maxval[2 * p + 1]
+            maxval[p] = lv if lv > rv else rv
+        return tree
+
+    def to_arrays(self):
+        ''' The tree as its (lc, rc, maxval, tag, roots) typed arrays. '''
+        return self.lc, self.rc, self.maxval, self.tag, self.roots
+
+    @classmethod
+    def from_arrays(cls, size, lc, rc, maxval, tag, roots):
+        ''' The tree with ''size'' leaves that to_arrays() returned the other
+        arrays for. '''
+        tree = cls(0)
+        tree.size = size
+        while tree._cap < size:
+            tree._cap <<= 1
+        tree.lc, tree.rc, tree.maxval, tree.tag, tree.roots = lc, rc, maxval, tag, roots
+        return tree
+
+    @property
+    def version(self):
+        ''' The latest version. '''
+        return len(self.roots) - 1
+
+    def _root(self, version):
+        return self.roots[-1 if version is None else version]
+
+    def _copy(self, p):
+        self.lc.append(self.lc[p])
+        self.rc.append(self.rc[p])
+        self.maxval.append(self.maxval[p])
+        self.tag.append(self.tag[p])
+        return len(self.tag) - 1
+
+    def _add(self, p, lo, hi, left, right, val):
+        if right < lo or hi < left:
+            return p
+        q = self._copy(p)
+        if left <= lo and hi <= right:
+            self.maxval[q] += val
+            self.tag[q] += val
+            return q
+        mid = (lo + hi) >> 1
+        lq = self._add(self.lc[p], lo, mid, left, right, val)
+        rq = self._add(self.rc[p], mid + 1, hi, left, right, val)
+        self.lc[q], self.rc[q] = lq, rq
+        lv, rv = self.maxval[lq], self.maxval[rq]
+        self.maxval[q] = (lv if lv > rv else rv) + self.tag[q]
+        return q
+
+    def add(self, left, right, val, new_version=True):
+        ''' Add ''val'' to leaves from ''left'' to ''right'' of the latest
+        version, as a new version unless ''new_version'' is false, in which
+        case the change is folded into the latest version. Returns the version
+        holding the change. '''
+        root = self._add(self.roots[-1], 1, self._cap, left, right, val)
+        if new_version:
+            self.roots.append(root)
+        else:
+            self.roots[-1] = root
+        return self.version
+
+    def add_suffix(self, idx, val):
+        ''' Add ''val'' to all leaves from ''idx'' to the end, as a new version. '''
+        return self.add(idx, self.size, val)
+
+    def max(self, version=None):
+        ''' The max over all leaves of ''version'' (the latest by default). '''
+        if self.size == 0:
+            return NEG_INF
+        return self.maxval[self._root(version)]
+
+    def get(self, idx, version=None):
+        ''' The value of the leaf with index ''idx'' in ''version''. '''
+        p, lo, hi = self._root(version), 1, self._cap
+        val = 0
+        while self.lc[p]:
+            val += self.tag[p]
+            mid = (lo + hi) >> 1
+            if idx <= mid:
+                p, hi = self.lc[p], mid
+            else:
+                p, lo = self.rc[p], mid + 1
+        return val + self.maxval[p]
+
+    def _query(self, p, lo, hi, left, right):
+        if right < lo or hi < left:
+            return NEG_INF
+        if left <= lo and hi <= right:
+            return self.maxval[p]
+        mid = (lo + hi) >> 1
+        lv = self._query(self.lc[p], lo, mid, left, right)
+        rv = self._query(self.rc[p], mid + 1, hi, left, right)
+        return (lv if lv > rv else rv) + self.tag[p]
+
+    def query(self, left, right, version=None):
+        ''' The max over leaves from ''left'' to ''right'' of ''version''. '''
+        if left > right:
+            return NEG_INF
+        return self._query(self._root(version), 1, self._cap, left, right)
+
+    def argmax(self, version=None):
+        ''' The index of a leaf holding the max of ''version'' (the leftmost one
+        on ties). '''
+        maxval, lc, rc = self.maxval, self.lc, self.rc
+        p, lo, hi = self._root(version), 1, self._cap
+        while lc[p]:
+            mid = (lo + hi) >> 1
+            if maxval[lc[p]] < maxval[rc[p]]:
+                p, lo = rc[p], mid + 1
+            else:
+                p, hi = lc[p], mid
+        return lo
+
+    def topk(self, k, version=None):
+        ''' The ''k'' largest leaves of ''version'' as (index, value) pairs,
+        largest first, by a best-first descent like LazySEGTree.topk(). '''
+        maxval, tag, lc, rc = self.maxval, self.tag, self.lc, self.rc
+        res = []
+        if k <= 0 or self.size == 0:
+            return res
+        root = self._root(version)
+        # (-value, first leaf, node, last leaf, tags above node)
+        heap = [(-maxval[root], 1, root, self._cap, 0)]
+        while heap and len(res) < k:
+            negval, lo, p, hi, pending = heapq.heappop(heap)
+            if not lc[p]:
+                res.append((lo, -negval))
+                continue
+            pending += tag[p]
+            mid = (lo + hi) >> 1
+            heapq.heappush(heap, (-(maxval[lc[p]] + pending), lo, lc[p], mid, pending))
+            if mid < self.size:
+                heapq.heappush(heap, (-(maxval[rc[p]] + pending), mid + 1, rc[p], hi, pending))
+        return res
+
+
 if __name__ == "__main__":
     l1 = [9, 2, 6, 3, 1, 5, 0, 7, 6]
     size = len(l1)
@@ -0,0 +1,102 @@
+##
+# Binary columnar task files, for inputs too large to parse as text.
+#
+# A task file is a header, the magic "TASKCOL1" and the number of tasks T as
+# an 8 byte integer, followed by two columns of T int32 values each: first all
+# the deadlines, then all the durations, in task order and native byte order.
+# Reading goes through mmap in chunks of CHUNK tasks, so only the chunk being
+# processed is ever resident, whatever the size of the file.
+#
+# Usage: python taskfile.py [text input] task file
+# converts a text input (see tasksched.py; stdin if omitted) to a task file.
+#
+import mmap
+import struct
+from array import array
+from itertools import islice
+
+MAGIC = "TASKCOL1"
+HEADER = "=8sq"
+HEADER_SIZE = struct.calcsize(HEADER)
+ITEM_SIZE = array('i').itemsize
+CHUNK = 1 << 16
+
+def column_offsets(ntasks):
+    ''' The file offsets of the deadline and duration columns. '''
+    return HEADER_SIZE, HEADER_SIZE + ntasks * ITEM_SIZE
+
+def write_task_file(path, deadlines, durations):
+    ''' Write the ''deadlines'' and ''durations'' columns to the task file
+    ''path''. '''
+    if len(deadlines) != len(durations):
+        raise ValueError("deadlines and durations differ in length")
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER, MAGIC, len(deadlines)))
+        array('i', deadlines).tofile(f)
+        array('i', durations).tofile(f)
+
+def convert_text(src, path, chunk=CHUNK):
+    ''' Convert the text input read from the stream ''src'' to the task file
+    ''path'', ''chunk'' lines at a time. '''
+    ntasks = int(src.readline())
+    dl_off, du_off = column_offsets(ntasks)
+    done = 0
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER, MAGIC, ntasks))
+        while done < ntasks:
+            lines = list(islice(src, min(chunk, ntasks - done)))
+            if not lines:
+                raise ValueError("expected %d tasks, got %d" % (ntasks, done))
+            vals = array('i', map(int, "".join(lines).split()))
+            f.seek(dl_off + done * ITEM_SIZE)
+            vals[0::2].tofile(f)
+            f.seek(du_off + done * ITEM_SIZE)
+            vals[1::2].tofile(f)
+            done += len(lines)
+        f.truncate(du_off + ntasks * ITEM_SIZE)
+    return ntasks
+
+def read_header(f):
+    ''' The number of tasks in the open task file ''f''. '''
+    f.seek(0)
+    magic, ntasks = struct.unpack(HEADER, f.read(HEADER_SIZE))
+    if magic != MAGIC:
+        raise ValueError("not a task file")
+    return ntasks
+
+def task_count(path):
+    ''' The number of tasks in the task file ''path''. '''
+    with open(path, "rb") as f:
+        return read_header(f)
+
+def iter_chunks(path, chunk=CHUNK):
+    ''' Iterate over the task file ''path'' as (deadlines, durations) pairs of
+    array('i') columns of at most ''chunk'' tasks each. '''
+    with open(path, "rb") as f:
+        ntasks = read_header(f)
+        if not ntasks:
+            return
+        dl_off, du_off = column_offsets(ntasks)
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(m) < du_off + ntasks * ITEM_SIZE:
+                raise ValueError("task file is truncated")
+            for lo in xrange(0, ntasks, chunk):
+                hi = min(lo + chunk, ntasks)
+                dl, du = array('i'), array('i')
+                dl.fromstring(m[dl_off + lo * ITEM_SIZE:dl_off + hi * ITEM_SIZE])
+                du.fromstring(m[du_off + lo * ITEM_SIZE:du_off + hi * ITEM_SIZE])
+                yield dl, du
+        finally:
+            m.close()
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) == 2:
+        convert_text(sys.stdin, sys.argv[1])
+    elif len(sys.argv) == 3:
+        with open(sys.argv[1]) as src:
+            convert_text(src, sys.argv[2])
+    else:
+        sys.exit("usage: %s [text input] task file" % sys.argv[0])
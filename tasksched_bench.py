@@ -0,0 +1,173 @@
+##
+# Benchmarks tasksched, tasksched_fast and tasksched_hackrank on seeded cases
+# from tasksched_tester.gen_tasks. An implementation can also be given as
+# module.Class for a scheduler other than the module's TaskScheduler, e.g.
+# tasksched_fast.BlockTaskScheduler.
+#
+# Every run happens in a fresh child process (this script with --child), so
+# the peak memory it reports belongs to that run alone. The parent writes one
+# row per run as tab separated values (or JSON lines with --format json):
+#
+#   impl dist ntasks seed parse prep sched total tasks_per_s peak_rss_kb
+#
+# Times are in seconds; parse covers reading the input and adding the tasks.
+# With --baseline, throughput is compared against an earlier table and the
+# exit status is 1 if any run got slower by more than --tolerance.
+#
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import tasksched_tester
+
+IMPLS = ("tasksched", "tasksched_fast", "tasksched_fast.BlockTaskScheduler",
+         "tasksched_hackrank")
+FIELDS = ("impl", "dist", "ntasks", "seed", "parse", "prep", "sched", "total",
+          "tasks_per_s", "peak_rss_kb")
+
+def _run_naive(stream):
+    import tasksched
+    import tasksched_fast
+    t0 = time.time()
+    ntasks, deadlines, durations = tasksched_fast.read_tasks(stream)
+    t1 = time.time()
+    tasks = []
+    answers = []
+    for idx in xrange(ntasks):
+        tasks.append((idx + 1, deadlines[idx], durations[idx]))
+        maxover, sched = tasksched.task_sched(tasks)
+        answers.append(max(maxover, 0))
+    t2 = time.time()
+    return t1 - t0, 0.0, t2 - t1
+
+def _run_scheduler(module, stream, clsname="TaskScheduler"):
+    t0 = time.time()
+    ntasks, deadlines, durations = module.read_tasks(stream)
+    tschedr = getattr(module, clsname)()
+    for idx in xrange(ntasks):
+        tschedr.add((idx + 1, deadlines[idx], durations[idx]))
+    t1 = time.time()
+    tschedr.prep()
+    t2 = time.time()
+    tschedr.sched()
+    t3 = time.time()
+    return t1 - t0, t2 - t1, t3 - t2
+
+def run_child(impl, path):
+    ''' Run ''impl'' on the case in ''path'' and return its phase times and
+    peak memory. Meant to be called in a fresh process. '''
+    with open(path) as stream:
+        if impl == "tasksched":
+            parse, prep, sched = _run_naive(stream)
+        else:
+            modname, _, clsname = impl.partition(".")
+            parse, prep, sched = _run_scheduler(__import__(modname), stream,
+                                                clsname or "TaskScheduler")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"parse": parse, "prep": prep, "sched": sched, "peak_rss_kb": rss}
+
+def bench(impl, dist, ntasks, seed, path):
+    ''' Run one benchmark in a child process and return its row. '''
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                   "--child", impl, path])
+    row = json.loads(out)
+    row["total"] = row["parse"] + row["prep"] + row["sched"]
+    row["tasks_per_s"] = ntasks / row["total"] if row["total"] > 0 else float("inf")
+    row.update({"impl": impl, "dist": dist, "ntasks": ntasks, "seed": seed})
+    return row
+
+def format_row(row, fmt):
+    if fmt == "json":
+        return json.dumps(dict((f, row[f]) for f in FIELDS), sort_keys=True)
+    cells = []
+    for f in FIELDS:
+        v = row[f]
+        cells.append("%.4f" % v if isinstance(v, float) else str(v))
+    return "\t".join(cells)
+
+def load_table(path):
+    ''' Load rows written by an earlier run, either format. '''
+    rows = []
+    with open(path) as f:
+        lines = [l for l in f.read().splitlines() if l.strip()]
+    if lines and lines[0].startswith("{"):
+        return [json.loads(l) for l in lines]
+    header = lines[0].split("\t")
+    for l in lines[1:]:
+        row = dict(zip(header, l.split("\t")))
+        row["ntasks"], row["seed"] = int(row["ntasks"]), int(row["seed"])
+        row["tasks_per_s"] = float(row["tasks_per_s"])
+        rows.append(row)
+    return rows
+
+def find_regressions(rows, baseline, tolerance):
+    ''' The (row, baseline row) pairs whose throughput dropped by more than
+    ''tolerance'' (a fraction). '''
+    key = lambda r: (r["impl"], r["dist"], r["ntasks"], r["seed"])
+    base = dict((key(r), r) for r in baseline)
+    res = []
+    for r in rows:
+        b = base.get(key(r))
+        if b and r["tasks_per_s"] < b["tasks_per_s"] * (1 - tolerance):
+            res.append((r, b))
+    return res
+
+
+if __name__ == "__main__":
+    import argparse
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        print json.dumps(run_child(sys.argv[2], sys.argv[3]))
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Benchmark the task schedulers.")
+    parser.add_argument("--impls", default=",".join(IMPLS),
+                        help="comma separated implementations (default: all)")
+    parser.add_argument("--dists", default=",".join(tasksched_tester.DISTRIBUTIONS),
+                        help="comma separated deadline distributions (default: all)")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="comma separated numbers of tasks")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--naive-max", type=int, default=5000,
+                        help="skip the O(n^2 log(n)) tasksched above this many tasks")
+    parser.add_argument("--format", choices=("tsv", "json"), default="tsv")
+    parser.add_argument("--baseline", help="table from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop vs. the baseline (default 0.2)")
+    args = parser.parse_args()
+
+    impls = args.impls.split(",")
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    rows = []
+    if args.format == "tsv":
+        print "\t".join(FIELDS)
+    tmpdir = tempfile.mkdtemp(prefix="tasksched_bench")
+    try:
+        for dist in args.dists.split(","):
+            for ntasks in sizes:
+                path = os.path.join(tmpdir, "%s_%d.txt" % (dist, ntasks))
+                with open(path, "w") as f:
+                    f.write(tasksched_tester.format_case(
+                        *tasksched_tester.gen_tasks(ntasks, dist, args.seed)))
+                for impl in impls:
+                    if impl == "tasksched" and ntasks > args.naive_max:
+                        continue
+                    row = bench(impl, dist, ntasks, args.seed, path)
+                    rows.append(row)
+                    print format_row(row, args.format)
+                    sys.stdout.flush()
+                os.remove(path)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if args.baseline:
+        regressions = find_regressions(rows, load_table(args.baseline), args.tolerance)
+        for r, b in regressions:
+            sys.stderr.write("REGRESSION %s %s %d: %.0f tasks/s (baseline %.0f)\n" %
+                             (r["impl"], r["dist"], r["ntasks"], r["tasks_per_s"],
+                              b["tasks_per_s"]))
+        if regressions:
+            sys.exit(1)
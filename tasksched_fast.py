@@ -1,105 +1,1369 @@
+import bisect
+import math
+import struct
+import time
+from array import array
+from itertools import islice
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import bitree
+import instrument
 import segtree
 
 ##
 # See tasksched.py for problem description and algorithm.
 #
+# Tasks are stored as parallel array('i') columns rather than as a list of
+# tuples, and the ranking is kept as typed arrays too. Task ids are 1 based
+# and follow the order in which the tasks were added.
+#
+# With ''persistent'', the segment tree keeps a version per step, so the state
+# after the first i tasks can still be queried once later tasks are in: see
+# the ''step'' argument of completion_time(), overshoot() and critical_task().
+#
+# save() and load() snapshot a scheduler as a header followed by its typed
+# arrays (the task columns, the rank maps, the bitree elements, the segment
+# tree arrays and, unless persistent, the advance() state), each as a
+# (typecode, count) header and its raw bytes in native byte order. Loading
+# reads each array straight from the file and the trees use them as they are.
+#
+# With ''topk'' > 0, each answer of sched() also lists the ''topk'' tasks that
+# overshoot the most. For that, the leaves of tasks not scheduled yet are kept
+# UNSCHEDULED below their value, so they can never crowd scheduled tasks out of
+# the top k, and each insert lifts its own leaf back.
+#
+# With ''stats'' (an instrument.Stats), the trees count their work into it and
+# sched() times each insert; see instrument.py. Without it nothing is counted.
+#
+# advance(now) moves a wall clock forward: the scheduled tasks that complete by
+# then are retired, their overshoots become final and only the largest one is
+# kept (''retired_max''), as a floor under every later answer. Tasks scheduled
+# afterwards start after the retired ones instead of going ahead of them.
+# Retiring a task is O(log(n)): it leaves the bitree, its leaf is pushed down by
+# UNSCHEDULED and left in place, and its duration is added to the leaves before
+# it, so that the tasks still to come there start after it too. Once retired
+# tasks fill half of the trees, the trees are rebuilt over the other tasks
+# only, in O(n), so they track the live tasks rather than every task ever
+# scheduled. The task columns are not compacted, and advance() needs
+# persistent=False.
+#
+# Tasks added after prep() are not in the trees. sched() keeps those it has
+# scheduled in a side buffer instead, sorted by (deadline, id) like the ranks:
+# lists of their ids, deadlines and overshoots (''_late_*''). Tasks are
+# scheduled by id, so by then every rank has been scheduled: no rank is
+# pending or inserted while the buffer holds tasks. Inserting one finds its
+# place among the ranks by binary search, starts it when the live task before
+# it (a rank or an entry) completes, and delays what comes after it: the ranks
+# with a single suffix add, the entries one by one. Answers and queries look
+# at both, and once the buffer holds max(LATE_MIN, 4 sqrt(n)) tasks, a rebuild
+# takes them into the trees. So a late task costs O(sqrt(n)) amortized, where
+# rebuilding for each would cost O(n). This also needs persistent=False.
+#
+# The leaf of a task not scheduled yet is only kept below the max by the leaf
+# of the scheduled task before it; once the clock runs, the pending tasks with
+# no live task before them (the ranks below ''_dormant_to'') are held down by
+# UNSCHEDULED instead, and let back up as tasks get scheduled before them.
+#
+UNSCHEDULED = 1 << 50
+LATE_MIN = 64
+SNAPSHOT_MAGIC = "TSCHED02"
+SNAPSHOT_HEADER = "=8s??qqqq"  # magic, persistent, prepped, topk, ntasks, nsched, narrays
+SNAPSHOT_ARRAY = "=cq"  # typecode, count
+
+def _column(arr):
+    ''' The typed array ''arr'' as an ndarray over the same memory. '''
+    return numpy.frombuffer(arr, dtype=numpy.dtype(arr.typecode))
+
+def _typed(typecode, size):
+    ''' A zeroed array(''typecode'') of ''size'' and an ndarray view of it, for
+    NumPy to fill in place. '''
+    arr = array(typecode, [0]) * size
+    return arr, _column(arr)
+
+def _stable_order(keys):
+    ''' The positions of ''keys'' (an array('i')) in key order, ties in
+    position order, as an array('i'). A counting sort when the keys span a
+    range not much wider than their number, else sorted(). Without NumPy
+    only: with it, numpy.argsort(kind="mergesort") does the same. '''
+    n = len(keys)
+    if not n:
+        return array('i')
+    lo, hi = min(keys), max(keys)
+    if hi - lo > 4 * n:
+        return array('i', sorted(xrange(n), key=keys.__getitem__))
+    # starts[k - lo] is where the next position with key k goes.
+    starts = array('l', [0]) * (hi - lo + 2)
+    for k in keys:
+        starts[k - lo + 1] += 1
+    for i in xrange(1, len(starts)):
+        starts[i] += starts[i - 1]
+    order = array('i', [0]) * n
+    for pos, k in enumerate(keys):
+        order[starts[k - lo]] = pos
+        starts[k - lo] += 1
+    return order
+
 class TaskScheduler(object):
-    def __init__(self):
-        self._tasks_by_id = []
-        self._tasks_by_rank = []
-        self._id2rank_map = []
+    def __init__(self, persistent=False, topk=0, stats=None):
+        self.persistent = persistent
+        self.topk = topk
+        self.stats = stats
+        self._ids = array('i')
+        self._deadlines = array('i')
+        self._durations = array('i')
+        self._id2rank_map = array('i')
+        self._rank2id_map = array('i')
         self.ntasks = 0
+        self.nretired = 0
+        self.retired_max = 0
 
     def add(self, tsk):
         ''' Each task ''tsk'' is a tuple of (task_index, deadline, duration). '''
-        self._tasks_by_id.append(tsk)
+        self._ids.append(tsk[0])
+        self._deadlines.append(tsk[1])
+        self._durations.append(tsk[2])
         self.ntasks += 1
 
-    def _task_by_id(self, id):
-        return self._tasks_by_id(id - 1)
-
-    def _task_by_rank(self, rank):
-        return self._tasks_by_rank[rank - 1]
+    def add_columns(self, deadlines, durations):
+        ''' Add the tasks given as columns ''deadlines'' and ''durations'', e.g.
+        as returned by read_tasks(). '''
+        n = len(deadlines)
+        self._ids.extend(xrange(self.ntasks + 1, self.ntasks + n + 1))
+        self._deadlines.extend(deadlines)
+        self._durations.extend(durations)
+        self.ntasks += n
 
     def _id2rank(self, id):
-        ''' both task id and task rank are 1 based. '''
+        ''' both task id and task rank are 1 based; retired tasks that were
+        dropped from the trees have rank 0. '''
         return (self._id2rank_map[id - 1] + 1)
 
+    def _rank_tasks(self, ids):
+        ''' Rank the tasks ''ids'' (an array('i'), or an int32 ndarray with
+        NumPy) by deadline, ties in the order given, straight into the typed
+        rank maps; the tasks left out get rank -1. Returns the deadlines in
+        rank order, as an int64 ndarray with NumPy and an array('i') without. '''
+        if numpy is not None:
+            if isinstance(ids, array):
+                ids = _column(ids)
+            dl = _column(self._deadlines).take(ids - 1)
+            order = numpy.argsort(dl, kind="mergesort")
+            self._rank2id_map, ranked = _typed('i', len(ids))
+            ids.take(order, out=ranked)
+            self._id2rank_map, id2rank = _typed('i', self.ntasks)
+            id2rank.fill(-1)
+            id2rank[ranked - 1] = numpy.arange(len(ranked), dtype=numpy.int32)
+            return dl.take(order).astype(numpy.int64)
+        deadlines = self._deadlines
+        dl = array('i', (deadlines[tid - 1] for tid in ids))
+        order = _stable_order(dl)
+        self._rank2id_map = array('i', (ids[i] for i in order))
+        self._id2rank_map = id2rank_map = array('i', [-1]) * self.ntasks
+        for rank, tid in enumerate(self._rank2id_map):
+            id2rank_map[tid - 1] = rank
+        return array('i', (dl[i] for i in order))
+
     def prep(self):
         ''' Prepare for scheduling for all tasks one by one. '''
-        # rank by deadline
-        self._tasks_by_rank = sorted(self._tasks_by_id, key=lambda t: t[1])
-        # build an index from task id => task rank, rank starts from 1 also
-        self._id2rank_map = self.ntasks * [None]
-        for i, t in enumerate(self._tasks_by_rank):
-            self._id2rank_map[t[0] - 1] = i
-        #print self._tasks_by_id
-        #print self._tasks_by_rank
-        #print self._id2rank_map
-        # initialize trees
-        self._bitree = bitree.BinaryIndexedTree(self.ntasks)
-        self._segtree = segtree.segtree_build_topdown(1, ntasks, segtree.negative_infinity_func)
-
-    def sched(self):
-        cache_stats = [0, 0] # (hits, misses)
-        for idx in xrange(1, self.ntasks + 1):
-            rank = self._id2rank(idx)
-            di, mi = self._task_by_rank(rank)[1:]
-            #print ">>>>>>"
-            #print "task idx %d rank %d mi %d di %d" % (idx, rank, mi, di)
-            # Now insert this task by its rank into the bitree and segtree
-            self._bitree.update(rank, mi)
-            # All we need to do now is to insert the new task into the segment tree now.
-            # Since all tasks after the new task will be delayed by the mi of task.
-            # We'll update the tree dynamically, meaning the value stored in the
-            # segment tree is supplied a function (v.s. a statically value). This way
-            # the *relative* rank of segment tree nodes are preserved, even though it
-            # doesn't have the value directly.
-            # Because we may need the same "sum" for a node repeatedly in the update
-            # process, we will cache the results here: this is important because
-            # if we don't we will end up with O(log(n)^2) for each update:
-            # O(log(n)) for depth of segment tree and O(log(n)) for each bitree summing
-            # function.
-            valcache = {}
-            def valfunc(node_rank):
-                if node_rank in valcache:
-                    cache_stats[0] += 1
-                    return valcache[node_rank]
-                cache_stats[1] += 1
-                node_idx, node_di, node_mi = self._task_by_rank(node_rank)
-                if node_idx > idx:
-                    # Don't count tasks that haven't been inserted.
-                    res = float("-inf")
+        # rank by deadline: a stable argsort (or counting sort) of the deadline
+        # column into typed rank maps, with no list of boxed ints on the way
+        dl = self._rank_tasks(self._ids)
+        # initialize trees: leaf i of the segment tree holds the overshoot of the
+        # task with rank i, counting only the tasks inserted so far. Before any
+        # insert that is just -deadline. A task not yet inserted never overshoots
+        # more than the closest inserted task before it (same completion time,
+        # later deadline), or 0 if there is none, so it can sit in the tree
+        # from the start and every insert is a single suffix add. The leaf of
+        # an inserted task plus its deadline is its completion time, so the
+        # bitree only needs to count the inserted tasks by rank, which is what
+        # locates the kth task of the schedule.
+        self._bitree = bitree.ArrayBinaryIndexedTree(self.ntasks)
+        if self.persistent:
+            treecls = segtree.PersistentSEGTree
+        else:
+            treecls = segtree.LazySEGTree
+        offset = UNSCHEDULED if self.topk else 0
+        if numpy is not None:
+            leaves = numpy.negative(dl, out=dl)
+            leaves -= offset
+        else:
+            leaves = array('l', (-di - offset for di in dl))
+        self._segtree = treecls.build(leaves)
+        self._nsched = 0
+        self._reset_clock(0)
+        self.nretired = 0
+        self.retired_max = 0
+        self._instrument()
+
+    def _instrument(self):
+        if self.stats is not None:
+            instrument.instrument(self._bitree, self.stats)
+            instrument.instrument(self._segtree, self.stats)
+
+    def _reset_clock(self, end):
+        ''' Start over with no retired task left in the trees, and the live
+        schedule starting at ''end''. '''
+        self._frozen = 0  # retired tasks still in the trees
+        self._retired = array('B', [0]) * len(self._rank2id_map)  # by rank
+        self._end = end  # when the work of the retired tasks ends
+        self._built = self.ntasks  # the tasks in the trees are ids 1 to _built
+        self._dormant_to = 0  # the first live rank, once the clock runs
+        # The buffer of late tasks scheduled and not retired (see above).
+        self._late_ids, self._late_dl, self._late_over = [], [], []
+        self._late_max = max(LATE_MIN, int(4 * math.sqrt(len(self._rank2id_map))))
+
+    def sched(self, upto=None, runs=False):
+        ''' Schedule the tasks one by one, up to task id ''upto'' (all tasks by
+        default), continuing from where the previous call stopped. Returns the
+        list of answers, one for each task scheduled by this call: the answer
+        for task i is the minimum max overshoot of the first i tasks. With
+        ''topk'', each answer is a tuple of that and critical_tasks(topk).
+
+        With ''runs'', only the answers that differ from the one before (or
+        from 0, for the first task) are returned, as (task id, answer) pairs:
+        see write_runs(). '''
+        if upto is None:
+            upto = self.ntasks
+        if runs and self.topk:
+            raise ValueError("runs cannot be combined with topk")
+        if upto > self._built and self.persistent:
+            raise ValueError("tasks added after prep() need persistent=False")
+        if self.stats is not None:
+            return self._sched_timed(upto, runs)
+        return self._sched(upto, runs)
+
+    def _sched_timed(self, upto, runs):
+        ''' sched() one task at a time, recording how long each insert took. '''
+        answers = []
+        for idx in xrange(self._nsched, upto):
+            t0 = time.time()
+            answers.extend(self._sched(idx + 1, runs))
+            self.stats.insert_done(time.time() - t0)
+        return answers
+
+    def _sched(self, upto, runs=False):
+        answers = []
+        id2rank_map, durations = self._id2rank_map, self._durations
+        late_dl, late_over = self._late_dl, self._late_over
+        floor, dormant_to = self.retired_max, self._dormant_to
+        # The answer of the last step scheduled so far, which a run continues.
+        last = 0
+        if self._nsched:
+            last = max(self._segtree.max(), floor)
+            if late_over:
+                last = max(last, max(late_over))
+        for idx in xrange(self._nsched, upto):
+            mi = durations[idx]
+            if idx >= self._built and len(late_dl) >= self._late_max:
+                # Take the buffer into the trees, and this task with it.
+                self._nsched, self._dormant_to = idx, dormant_to
+                self._rebuild()
+                id2rank_map, dormant_to = self._id2rank_map, self._dormant_to
+                late_dl, late_over = self._late_dl, self._late_over
+            if idx < self._built:
+                rank = id2rank_map[idx] + 1
+                # Now insert this task by its rank into the bitree and segtree:
+                # the task and all tasks after it complete mi later.
+                self._bitree.update(rank, 1)
+                self._segtree.add_suffix(rank, mi)
+                if rank < dormant_to:
+                    self._segtree.add(rank, dormant_to - 1, UNSCHEDULED)
+                    dormant_to = rank
+                if self.topk:
+                    self._lift(rank)
+            else:
+                self._sched_late(idx)
+            maxover = self._segtree.max()
+            if late_over:
+                maxover = max(maxover, max(late_over))
+            if maxover < floor:
+                maxover = floor
+            if self.topk:
+                self._nsched = idx + 1
+                answers.append((maxover, self.critical_tasks(self.topk)))
+            elif runs:
+                # Answers never go down, so most steps just extend a run.
+                if maxover != last:
+                    answers.append((idx + 1, maxover))
+                    last = maxover
+            else:
+                answers.append(maxover)
+        self._nsched = max(self._nsched, upto)
+        self._dormant_to = dormant_to
+        return answers
+
+    def _sched_late(self, idx):
+        ''' Schedule task ''idx'' + 1, added since the trees were built, into
+        the buffer (see above). O(log(n) + buffer size). '''
+        d, mi = self._deadlines[idx], self._durations[idx]
+        late_dl, late_over = self._late_dl, self._late_over
+        p = self._tree_before(d)
+        j = bisect.bisect_right(late_dl, d)
+        # It starts when the live task before it completes: the last one
+        # scheduled among ranks 1 to p, or entry j - 1, whichever is later.
+        start = self._end
+        before = self._bitree.sum(p)
+        if before:
+            rank = self._bitree.find_prefix(before)
+            start = self._segtree.get(rank) + self._deadlines[self._rank2id_map[rank - 1] - 1]
+        if j:
+            start = max(start, late_over[j - 1] + late_dl[j - 1])
+        self._late_ids.insert(j, idx + 1)
+        late_dl.insert(j, d)
+        late_over.insert(j, start + mi - d)
+        for i in xrange(j + 1, len(late_over)):
+            late_over[i] += mi
+        self._segtree.add_suffix(p + 1, mi)
+
+    def _tree_before(self, deadline):
+        ''' The number of ranks due by ''deadline''. O(log(n)). '''
+        deadlines, rank2id_map = self._deadlines, self._rank2id_map
+        lo, hi = 0, len(rank2id_map)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if deadlines[rank2id_map[mid] - 1] <= deadline:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _late_pos(self, i):
+        ''' The position (1 based) of buffer entry ''i'' in the live schedule. '''
+        return i + 1 + self._bitree.sum(self._tree_before(self._late_dl[i]))
+
+    def _late_upto(self, k):
+        ''' The number of buffer entries among the first ''k'' tasks of the live
+        schedule. '''
+        lo, hi = 0, len(self._late_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._late_pos(mid) <= k:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _late_index(self, task_id):
+        ''' The buffer entry of task ''task_id'', or None if it was retired. '''
+        deadline, late_ids = self._deadlines[task_id - 1], self._late_ids
+        i = bisect.bisect_left(self._late_dl, deadline)
+        while i < len(late_ids) and self._late_dl[i] == deadline:
+            if late_ids[i] == task_id:
+                return i
+            i += 1
+        return None
+
+    def _lift(self, rank):
+        ''' Lift the leaf of a newly scheduled task by UNSCHEDULED. '''
+        if self.persistent:
+            self._segtree.add(rank, rank, UNSCHEDULED, new_version=False)
+        else:
+            self._segtree.add(rank, rank, UNSCHEDULED)
+
+    def advance(self, now):
+        ''' Move the clock to ''now'': retire the scheduled tasks that complete
+        by then (see above). Returns the number of tasks retired. '''
+        if self.persistent:
+            raise ValueError("advance() needs persistent=False")
+        # Completion times grow along the schedule, so the tasks done by now
+        # are a prefix of it.
+        view = self.schedule()
+        lo, hi = 0, len(view)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if view[mid][2] <= now:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo:
+            self._end = view[lo - 1][2]
+            nlate = self._late_upto(lo)
+            ranks = [self._bitree.find_prefix(i) for i in xrange(1, lo - nlate + 1)]
+            self.retired_max = max([self.retired_max] + [self._segtree.get(r) for r in ranks] +
+                                   self._late_over[:nlate])
+            for rank in ranks:
+                tid = self._rank2id_map[rank - 1]
+                self._bitree.update(rank, 0)
+                self._retired[rank - 1] = 1
+                self._segtree.add(1, rank - 1, self._durations[tid - 1])
+                self._segtree.add(rank, rank, -UNSCHEDULED)
+            # With no rank pending, retired buffer entries just leave.
+            del self._late_ids[:nlate], self._late_dl[:nlate], self._late_over[:nlate]
+            self._frozen += lo - nlate
+            self.nretired += lo
+        size = len(self._rank2id_map)
+        if self._nsched == self.nretired and now > self._end:
+            # Nothing left to run: the tasks to come start now at the earliest.
+            self._segtree.add(1, size, now - self._end)
+            self._end = now
+        if 2 * self._frozen >= size:
+            self._rebuild(clocked=True)
+        elif not self.topk:
+            # Hold down the pending tasks that lost their last live task
+            # before them; those below the old _dormant_to already are.
+            dormant_to = self._bitree.find_prefix(1)
+            self._segtree.add(max(self._dormant_to, 1), dormant_to - 1, -UNSCHEDULED)
+            self._dormant_to = dormant_to
+        return lo
+
+    def _rebuild(self, clocked=False):
+        ''' Rebuild the trees over the tasks not retired, including those
+        added since (and the buffer), with the live schedule starting at
+        ''_end''. O(n). '''
+        clocked = (clocked or self._dormant_to > 0) and not self.topk
+        if self.persistent:
+            raise ValueError("tasks added after prep() need persistent=False")
+        nsched, durations = self._nsched, self._durations
+        offset = UNSCHEDULED if self.topk else 0
+        # The ranks and the buffer already hold their tasks in deadline order;
+        # the ones added since go after them (by id, as they all do on ties),
+        # and the stable sort slots them in.
+        pending = max(self._built, nsched) + 1
+        if numpy is not None:
+            live = _column(self._rank2id_map)[_column(self._retired) == 0]
+            dl = self._rank_tasks(numpy.concatenate(
+                [live, numpy.array(self._late_ids, dtype=numpy.int32),
+                 numpy.arange(pending, self.ntasks + 1, dtype=numpy.int32)]))
+            ids = _column(self._rank2id_map)
+            scheduled = ids <= nsched
+            leaves = self._end + numpy.cumsum(
+                _column(durations)[ids - 1].astype(numpy.int64) * scheduled) - dl
+            first = int(scheduled.argmax()) if scheduled.any() else len(ids)
+            dormant_to = first + 1 if clocked else 0
+            if clocked:
+                leaves[:first] -= UNSCHEDULED
+                leaves[first:][~scheduled[first:]] -= offset
+            else:
+                leaves[~scheduled] -= offset
+            self._bitree = bitree.ArrayBinaryIndexedTree.from_values(scheduled)
+        else:
+            ids = array('i', (tid for tid, retired in zip(self._rank2id_map, self._retired)
+                              if not retired))
+            ids.extend(self._late_ids)
+            ids.extend(xrange(pending, self.ntasks + 1))
+            dl = self._rank_tasks(ids)
+            counts = array('l', [0]) * len(dl)
+            leaves = array('l', [0]) * len(dl)
+            curtime = self._end
+            dormant_to = len(dl) + 1 if clocked else 0
+            for rank, tid in enumerate(self._rank2id_map):
+                if tid <= nsched:
+                    curtime += durations[tid - 1]
+                    leaves[rank] = curtime - dl[rank]
+                    counts[rank] = 1
+                    dormant_to = min(dormant_to, rank + 1)
+                elif rank + 1 < dormant_to:
+                    leaves[rank] = curtime - dl[rank] - UNSCHEDULED
                 else:
-                    res = self._bitree.sum(node_rank) - node_di
-                valcache[node_rank] = res
-                return res
-            segtree.segtree_update(self._segtree, rank, valfunc)
-            maxrank = self._segtree.maxnode.interval[0]
-            #self._bitree.display()
-            #segtree.segtree_print(self._segtree)
-            #print "max idx %d rank %d over %d" % (self._task_by_rank(maxrank)[0], maxrank, valfunc(maxrank))
-            maxover = valfunc(maxrank)
-            if maxover < 0:
-                maxover = 0
-            print maxover
-        print "cache hits: %d cache misses %d" % (cache_stats[0], cache_stats[1])
+                    leaves[rank] = curtime - dl[rank] - offset
+            self._bitree = bitree.ArrayBinaryIndexedTree.from_values(counts)
+        self._segtree = segtree.LazySEGTree.build(leaves)
+        self._reset_clock(self._end)
+        self._dormant_to = dormant_to
+        self._instrument()
+
+    def _at(self, step):
+        ''' Segment tree query arguments for the state after ''step'' tasks. '''
+        if step is None or step == self._nsched:
+            return {}
+        if not self.persistent:
+            raise ValueError("past steps can only be queried with persistent=True")
+        if step < 0 or step > self._nsched:
+            raise ValueError("step %d has not been scheduled" % step)
+        return {"version": step}
+
+    def completion_time(self, task_id, step=None):
+        ''' When task ''task_id'' completes in the optimal schedule of the first
+        ''step'' tasks (all tasks scheduled so far by default). O(log(n)). '''
+        kw = self._at(step)
+        if task_id < 1 or task_id > (self._nsched if step is None else step):
+            raise ValueError("task %d has not been scheduled" % task_id)
+        if task_id > self._built:
+            i = self._late_index(task_id)
+            if i is None:
+                raise ValueError("task %d has been retired" % task_id)
+            return self._late_over[i] + self._late_dl[i]
+        if not self.persistent and (not self._id2rank(task_id) or
+                                    self._retired[self._id2rank(task_id) - 1]):
+            raise ValueError("task %d has been retired" % task_id)
+        return self._segtree.get(self._id2rank(task_id), **kw) + self._deadlines[task_id - 1]
+
+    def overshoot(self, task_id, step=None):
+        ''' How much task ''task_id'' overshoots its deadline (negative if it
+        completes early) in the optimal schedule of the first ''step'' tasks. '''
+        return self.completion_time(task_id, step) - self._deadlines[task_id - 1]
+
+    def critical_task(self, step=None):
+        ''' The (task id, overshoot) of the task overshooting the most in the
+        optimal schedule of the first ''step'' tasks, or None if every task
+        completes before its deadline. Retired tasks are left out. '''
+        kw = self._at(step)
+        best = None
+        # A task not scheduled yet can only hold the max if no scheduled task
+        # comes before it, and then the max is below 0.
+        if self._segtree.max(**kw) >= 0:
+            rank = self._segtree.argmax(**kw)
+            best = (self._rank2id_map[rank - 1], self._segtree.get(rank, **kw))
+        late_over = self._late_over
+        if late_over and max(late_over) >= 0:
+            # On ties, the task that comes first in the schedule.
+            i = late_over.index(max(late_over))
+            if (best is None or late_over[i] > best[1] or
+                    (late_over[i] == best[1] and self._tree_before(self._late_dl[i]) < rank)):
+                best = (self._late_ids[i], late_over[i])
+        return best
+
+    def critical_tasks(self, k, step=None):
+        ''' The (task id, overshoot) of the ''k'' tasks overshooting the most in
+        the optimal schedule of the first ''step'' tasks, most first. Only
+        available with ''topk'' > 0. O(k log(n)). '''
+        if not self.topk:
+            raise ValueError("critical_tasks() needs topk > 0")
+        kw = self._at(step)
+        late = zip(self._late_ids, self._late_over)
+        nsched = self._nsched - self.nretired - len(late) if step is None else step
+        rank2id_map = self._rank2id_map
+        best = [(rank2id_map[rank - 1], over)
+                for rank, over in self._segtree.topk(min(k, nsched), **kw)]
+        if late:
+            best = sorted(best + late, key=lambda entry: -entry[1])[:k]
+        return best
+
+    def schedule(self):
+        ''' A lazy view of the optimal schedule of the tasks scheduled so far,
+        but not retired. '''
+        return ScheduleView(self)
+
+    def save(self, path):
+        ''' Save the scheduler to ''path'' in the snapshot format below, so
+        load() can pick up exactly where it left off. '''
+        prepped = hasattr(self, "_segtree")
+        if prepped and self._late_ids:
+            # The snapshot has no room for the buffer.
+            self._rebuild()
+        arrays = [self._ids, self._deadlines, self._durations]
+        if prepped:
+            arrays += [self._id2rank_map, self._rank2id_map]
+            arrays += self._bitree.to_arrays()
+            arrays += self._segtree.to_arrays()
+            if not self.persistent:
+                arrays.append(array('l', [self.nretired, self.retired_max, self._frozen,
+                                          self._end, self._built, self._dormant_to]))
+                arrays.append(self._retired)
+        with open(path, "wb") as f:
+            f.write(struct.pack(SNAPSHOT_HEADER, SNAPSHOT_MAGIC, self.persistent, prepped,
+                                self.topk, self.ntasks, getattr(self, "_nsched", 0),
+                                len(arrays)))
+            for arr in arrays:
+                f.write(struct.pack(SNAPSHOT_ARRAY, arr.typecode, len(arr)))
+                arr.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        ''' Load a scheduler saved with save(). '''
+        with open(path, "rb") as f:
+            header = f.read(struct.calcsize(SNAPSHOT_HEADER))
+            magic, persistent, prepped, topk, ntasks, nsched, narrays = \
+                struct.unpack(SNAPSHOT_HEADER, header)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError("%s is not a TaskScheduler snapshot" % path)
+            arrays = []
+            for i in xrange(narrays):
+                typecode, count = struct.unpack(SNAPSHOT_ARRAY,
+                                                f.read(struct.calcsize(SNAPSHOT_ARRAY)))
+                arr = array(typecode)
+                arr.fromfile(f, count)
+                arrays.append(arr)
+        tschedr = cls(persistent=bool(persistent), topk=topk)
+        tschedr.ntasks = ntasks
+        tschedr._ids, tschedr._deadlines, tschedr._durations = arrays[:3]
+        if prepped:
+            tschedr._id2rank_map, tschedr._rank2id_map = arrays[3:5]
+            tschedr._bitree = bitree.ArrayBinaryIndexedTree.from_arrays(*arrays[5:7])
+            size = len(tschedr._rank2id_map)
+            tschedr._nsched = nsched
+            tschedr._reset_clock(0)
+            if persistent:
+                tschedr._segtree = segtree.PersistentSEGTree.from_arrays(size, *arrays[7:])
+            else:
+                tschedr._segtree = segtree.LazySEGTree.from_arrays(size, *arrays[7:9])
+                if len(arrays) > 9:
+                    (tschedr.nretired, tschedr.retired_max, tschedr._frozen,
+                     tschedr._end, tschedr._built, tschedr._dormant_to) = arrays[9]
+                    tschedr._retired = arrays[10]
+        return tschedr
+
+
+VIEW_CHUNK = 256
+
+class ScheduleView(object):
+    ''' The optimal schedule of the tasks a TaskScheduler has scheduled so far,
+    as a sequence of (tid, start, end) like tasksched.task_sched() returns. It
+    is never materialized: view[k] is O(log(n)) and view[a:b] O((b - a) log(n)),
+    however many ranks of tasks not scheduled yet or retired lie in between,
+    and iterating goes VIEW_CHUNK entries at a time. The view follows the
+    scheduler as it goes on. '''
+    def __init__(self, tschedr):
+        self._tschedr = tschedr
 
+    def __len__(self):
+        return self._tschedr._nsched - self._tschedr.nretired
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return [self[k] for k in xrange(start, stop, step)]
+            return self._slice(start, stop)
+        n = len(self)
+        if key < 0:
+            key += n
+        if key < 0 or key >= n:
+            raise IndexError("schedule index out of range")
+        return self._slice(key, key + 1)[0]
+
+    def __iter__(self):
+        start = 0
+        while start < len(self):
+            chunk = self._slice(start, min(start + VIEW_CHUNK, len(self)))
+            for entry in chunk:
+                yield entry
+            start += len(chunk)
+
+    def _slice(self, start, stop):
+        if start >= stop:
+            return []
+        ts = self._tschedr
+        bt, rank2id_map, durations = ts._bitree, ts._rank2id_map, ts._durations
+        late_ids = ts._late_ids
+        # The buffer entries before the slice, and the position of the next.
+        j = ts._late_upto(start)
+        nextpos = ts._late_pos(j) if j < len(late_ids) else None
+        curtime = None
+        res = []
+        # The bitree counts the live scheduled tasks by rank, so the kth of
+        # them is found directly, whatever the gaps between their ranks.
+        for k in xrange(start + 1, stop + 1):
+            if k == nextpos:
+                tid = late_ids[j]
+                j += 1
+                nextpos = ts._late_pos(j) if j < len(late_ids) else None
+            else:
+                tid = rank2id_map[bt.find_prefix(k - j) - 1]
+            if curtime is None:
+                curtime = ts.completion_time(tid) - durations[tid - 1]
+            et = curtime + durations[tid - 1]
+            res.append((tid, curtime, et))
+            curtime = et
+        return res
+
+##
+# The online scheduler does not need to see the whole input: the trees are
+# indexed by deadline over the bounded domain 1..MAX_DEADLINE (see the
+# constraints in tasksched.py) instead of by rank. Tasks sharing a deadline
+# share a leaf. As in TaskScheduler, every leaf starts at -deadline: a deadline
+# nobody uses never overshoots more than the closest used deadline before it.
+# The leaf of deadline d plus d is the total duration of the tasks due by d.
+#
+# add_many() works on whole arrays instead (with NumPy): the leaves are just
+# the running sum of ''_load'', the total duration per deadline, minus the
+# deadline. It updates ''_load'' only and leaves the segment tree stale until a
+# single-task method needs it again, so bursts of add_many() calls never touch
+# the tree.
+#
+# Without ''keep_tasks'', tasks are not remembered individually (so remove()
+# and update() are not available) and memory does not grow with the number of
+# tasks at all.
+#
+# With a ''width'' above 1, the scheduler is approximate: deadlines are grouped
+# into buckets of ''width'' consecutive deadlines, sharing a leaf that starts
+# at minus the lowest deadline of the bucket, so the trees shrink by a factor
+# of ''width''. The leaf of bucket b is then P(hi) - lo, where lo and hi are its
+# lowest and highest deadlines and P(d) the total duration due by d. For every
+# deadline d in the bucket, P(d) - d <= P(hi) - lo, and P(hi) - hi is the exact
+# value at hi, so the max over the buckets is never below the exact max
+# overshoot and at most hi - lo <= width - 1 above it (see error_bound and
+# bounds()). probe() and max_admissible_duration() err on the same side: the
+# durations they admit never overshoot the budget.
+#
+MAX_DEADLINE = 100000
+ADD_MANY_BLOCK = 256
+MAX_DELAY_CELLS = 1 << 19  # bounds the tasks by segments matrix (4 MB of int64)
+APPLY_OPS_RATIO = 256  # smaller apply_ops() batches go op by op
+
+def _block_maxima(leaves, keys, durations, max_cells=None):
+    ''' The max over ''leaves'' (an ndarray) after each task of a block, where
+    each task adds its duration to the leaves from its (1 based) leaf in
+    ''keys'' on. Returns the maxima and the number of segments kept. A block
+    with negative durations (removals) keeps every segment.
+
+    With ''max_cells'', only as many of the first tasks as keep the delays
+    within that many cells (but at least one) get their maxima: the caller
+    goes on from the first task left out. '''
+    # Segment s runs from the sth distinct key of the block up to the next
+    # one; the leaves before the first are not delayed.
+    uniq, seg = numpy.unique(keys, return_inverse=True)
+    segmax = numpy.maximum.reduceat(leaves, uniq - 1)
+    # A segment is delayed at least as much as any segment before it, so only
+    # the segments whose max beats every later segment can ever hold the
+    # answer. Each task delays the first such segment at or after its own and
+    # everything after that.
+    if durations.min() < 0:
+        # A later segment can fall back below an earlier one.
+        kept = numpy.arange(len(segmax))
+    else:
+        later = numpy.maximum.accumulate(segmax[::-1])[::-1]
+        kept = numpy.flatnonzero(segmax[:-1] > later[1:])
+        kept = numpy.append(kept, len(segmax) - 1)
+    ntasks = len(keys)
+    if max_cells is not None:
+        # The segments of the whole block still fit a prefix of it, just cut
+        # finer than the prefix alone would need.
+        ntasks = min(ntasks, max(max_cells // len(kept), 1))
+    col = numpy.searchsorted(kept, seg[:ntasks])
+    delay = numpy.zeros((ntasks, len(kept)), dtype=numpy.int64)
+    delay[numpy.arange(ntasks), col] = durations[:ntasks]
+    delay.cumsum(axis=0, out=delay)
+    delay.cumsum(axis=1, out=delay)
+    delay += segmax[kept]
+    best = delay.max(axis=1)
+    if uniq[0] > 1:
+        best = numpy.maximum(best, leaves[:uniq[0] - 1].max())
+    return best, len(kept)
+
+class OnlineTaskScheduler(object):
+    def __init__(self, max_deadline=MAX_DEADLINE, keep_tasks=True, width=1):
+        self.max_deadline = max_deadline
+        self.keep_tasks = keep_tasks
+        self.width = width
+        self.nbuckets = (max_deadline + width - 1) // width
+        self.ntasks = 0
+        self._next_id = 1  # past every integer id added so far, never goes down
+        self._tasks = {}  # task id => (deadline, duration)
+        self._load = array('l', [0]) * self.nbuckets  # bucket - 1 => duration
+        self._segtree = segtree.LazySEGTree.build(
+            [-lo for lo in xrange(1, max_deadline + 1, width)])
+        self._stale_max = None  # the max overshoot while the tree is stale
+
+    @property
+    def error_bound(self):
+        ''' How much maxover() can exceed the exact max overshoot. '''
+        return self.width - 1
+
+    def bounds(self):
+        ''' The (lowest, highest) the exact max overshoot can be. '''
+        maxover = self.maxover()
+        return max(maxover - self.error_bound, 0), maxover
+
+    def _bucket(self, di):
+        ''' The (1 based) leaf of deadline ''di''. '''
+        return (di - 1) // self.width + 1
+
+    def _check_deadline(self, di):
+        if di < 1 or di > self.max_deadline:
+            raise ValueError("deadline %d outside of 1..%d" % (di, self.max_deadline))
+
+    def _sync(self):
+        ''' Rebuild the segment tree from ''_load'' after add_many(). O(n), in
+        NumPy (add_many() only leaves the tree stale with NumPy). '''
+        if self._stale_max is not None:
+            self._segtree = segtree.LazySEGTree.build(self._leaves())
+            self._stale_max = None
+
+    def _leaves(self, out=None):
+        ''' The segment tree leaves as an ndarray, computed from ''_load'' (into
+        ''out'' if given). '''
+        load = numpy.frombuffer(self._load, dtype=numpy.dtype(self._load.typecode))
+        leaves = numpy.cumsum(load, out=out)
+        leaves -= numpy.arange(1, self.max_deadline + 1, self.width)
+        return leaves
+
+    def _insert(self, di, mi):
+        ''' Add ''mi'' minutes of work with deadline ''di'' to the trees. '''
+        self._sync()
+        b = self._bucket(di)
+        self._load[b - 1] += mi
+        self._segtree.add_suffix(b, mi)
+
+    def _delete(self, di, mi):
+        ''' Take ''mi'' minutes of work with deadline ''di'' out of the trees. '''
+        self._insert(di, -mi)
+
+    def add(self, tsk):
+        ''' Each task ''tsk'' is a tuple of (task_index, deadline, duration).
+        Returns the minimum max overshoot of all tasks added so far. '''
+        tid, di, mi = tsk
+        self._check_deadline(di)
+        if self.keep_tasks and tid in self._tasks:
+            raise ValueError("task %s already added" % (tid,))
+        self._insert(di, mi)
+        if self.keep_tasks:
+            self._tasks[tid] = (di, mi)
+        self._took_ids((tid,))
+        self.ntasks += 1
+        return self.maxover()
+
+    def _took_ids(self, ids):
+        ''' Move ''_next_id'' past the integer ids among ''ids''. '''
+        for tid in ids:
+            if isinstance(tid, (int, long)) and tid >= self._next_id:
+                self._next_id = tid + 1
+
+    def add_many(self, deadlines, durations, ids=None):
+        ''' Add a batch of tasks given as columns, with ids ''ids'' (by default
+        counting on from the highest id added so far). Returns the answer
+        after each task of the batch, as add() would have. Durations must not
+        be negative.
+
+        With NumPy the batch is cut into blocks of ADD_MANY_BLOCK tasks or
+        more, cut short where the delays below would pass MAX_DELAY_CELLS
+        cells. For each block, the distinct deadlines cut the domain into
+        segments whose leaves all move together within the block, so the
+        answers are the row maxima of (segment max before the block) plus a
+        2D running sum of the block's durations by task and by segment, and
+        the block is then applied to ''_load'' as a single running sum. '''
+        n = len(deadlines)
+        if ids is None:
+            ids = xrange(self._next_id, self._next_id + n)
+        if self.keep_tasks:
+            ids = list(ids)
+            if len(ids) != n:
+                raise ValueError("deadlines and ids differ in length")
+        if len(durations) != n:
+            raise ValueError("deadlines and durations differ in length")
+        if numpy is None:
+            return [self.add(tsk) for tsk in zip(ids, deadlines, durations)]
+        dl = numpy.asarray(deadlines, dtype=numpy.int64)
+        du = numpy.asarray(durations, dtype=numpy.int64)
+        if n and (dl.min() < 1 or dl.max() > self.max_deadline):
+            bad = dl[(dl < 1) | (dl > self.max_deadline)][0]
+            self._check_deadline(int(bad))
+        if self.keep_tasks and (len(set(ids)) != n or any(tid in self._tasks for tid in ids)):
+            raise ValueError("task ids already added")
+
+        bk = (dl - 1) // self.width + 1
+        load = numpy.frombuffer(self._load, dtype=numpy.dtype(self._load.typecode))
+        leaves = self._leaves()
+        answers = []
+        block = ADD_MANY_BLOCK
+        start = 0
+        while start < n:
+            bdl, bdu = bk[start:start + block], du[start:start + block]
+            best, nkept = _block_maxima(leaves, bdl, bdu, MAX_DELAY_CELLS)
+            taken = len(best)
+            start += taken
+            answers.extend(numpy.maximum(best, 0).tolist())
+            numpy.add.at(load, bdl[:taken] - 1, bdu[:taken])
+            self._leaves(out=leaves)
+            # The block costs O(nbuckets) plus block * kept for the delays,
+            # so the fewer segments are kept, the larger the next block can be.
+            block = int(min(16, (taken / float(nkept)) ** 0.5) * ADD_MANY_BLOCK)
+        if self.keep_tasks:
+            self._tasks.update(zip(ids, zip(dl.tolist(), du.tolist())))
+        # An xrange (the default ids without keep_tasks) peaks at an end.
+        self._took_ids((ids[0], ids[-1]) if isinstance(ids, xrange) and n else ids)
+        self.ntasks += n
+        if n:
+            self._stale_max = int(leaves.max())
+        return answers
+
+    def _task(self, task_id):
+        if not self.keep_tasks:
+            raise ValueError("tasks are not kept (keep_tasks=False)")
+        return self._tasks[task_id]
+
+    def remove(self, task_id):
+        ''' Cancel the task with id ''task_id''. Returns the new max overshoot. '''
+        di, mi = self._task(task_id)
+        del self._tasks[task_id]
+        self._delete(di, mi)
+        self.ntasks -= 1
+        return self.maxover()
+
+    def update(self, task_id, deadline=None, duration=None):
+        ''' Move the deadline and/or change the duration of the task with id
+        ''task_id''. Returns the new max overshoot. '''
+        di, mi = self._task(task_id)
+        newdi = di if deadline is None else deadline
+        newmi = mi if duration is None else duration
+        self._check_deadline(newdi)
+        self._delete(di, mi)
+        self._insert(newdi, newmi)
+        self._tasks[task_id] = (newdi, newmi)
+        return self.maxover()
+
+    def apply_batch(self, added=(), removed=()):
+        ''' Add the tasks ''added'' (tuples as for add()) and remove the tasks
+        with ids ''removed'' in one go. The changes are merged per deadline
+        first, so the tree takes one suffix add per distinct deadline however
+        many tasks share it. Returns the new max overshoot. Nothing changes if
+        the batch is invalid. '''
+        added = list(added)
+        removed = list(removed)
+        newids = set(tsk[0] for tsk in added)
+        if len(newids) != len(added) or any(tid in self._tasks for tid in newids):
+            raise ValueError("task ids already added")
+        if len(set(removed)) != len(removed):
+            raise ValueError("task ids removed twice")
+        changes = []
+        for tid, di, mi in added:
+            self._check_deadline(di)
+            changes.append((di, mi))
+        for tid in removed:
+            di, mi = self._task(tid)
+            changes.append((di, -mi))
+        self._apply_merged(changes)
+        self._commit(added, removed, newids)
+        return self.maxover()
+
+    def _apply_merged(self, changes):
+        ''' Apply the (deadline, duration) ''changes'' to the trees with one
+        suffix add per bucket. '''
+        delta = {}
+        for di, mi in changes:
+            b = self._bucket(di)
+            delta[b] = delta.get(b, 0) + mi
+        self._sync()
+        for b, mi in delta.iteritems():
+            if mi:
+                self._load[b - 1] += mi
+                self._segtree.add_suffix(b, mi)
+
+    def _commit(self, added, removed, ids):
+        ''' Book the tasks ''added'' and ''removed'' once the trees hold them,
+        and move ''_next_id'' past ''ids''. '''
+        if self.keep_tasks:
+            for tid in removed:
+                del self._tasks[tid]
+            for tid, di, mi in added:
+                self._tasks[tid] = (di, mi)
+        self._took_ids(ids)
+        self.ntasks += len(added) - len(removed)
+
+    def apply_ops(self, ops):
+        ''' Apply ''ops'', a list of ("ADD", (tid, deadline, duration)),
+        ("REMOVE", tid) and ("QUERY", None), and return the max overshoot
+        right after each of them in order. A task may be added and removed
+        within ''ops''; it then never reaches the tree. Nothing changes if
+        ''ops'' is invalid.
+
+        A batch of fewer than nbuckets / APPLY_OPS_RATIO ops (or any batch
+        without NumPy) goes to the tree one op at a time, reading the max
+        after each, in O(k log(n)). A larger one is applied as one
+        apply_batch() would, with the answers from _block_maxima() over the
+        leaves before the batch, a removal counting as a negative duration
+        and a query as none. '''
+        added = {}  # task id => (deadline, duration), added within ops
+        removed = set()
+        changes = []  # (deadline, duration) per op
+        for kind, arg in ops:
+            if kind == "ADD":
+                tid, di, mi = arg
+                self._check_deadline(di)
+                if tid in added or tid in self._tasks:
+                    raise ValueError("task %s already added" % (tid,))
+                added[tid] = (di, mi)
+                changes.append((di, mi))
+            elif kind == "REMOVE":
+                if arg in added:
+                    di, mi = added.pop(arg)
+                elif arg in removed:
+                    raise ValueError("task %s removed twice" % (arg,))
+                else:
+                    di, mi = self._task(arg)
+                    removed.add(arg)
+                changes.append((di, -mi))
+            elif kind == "QUERY":
+                changes.append((1, 0))
+            else:
+                raise ValueError("bad op %r" % (kind,))
+        if numpy is None or len(changes) * APPLY_OPS_RATIO < self.nbuckets:
+            answers = []
+            for di, mi in changes:
+                if mi:
+                    self._insert(di, mi)
+                answers.append(self.maxover())
+        else:
+            bk = numpy.array([self._bucket(di) for di, mi in changes], dtype=numpy.int64)
+            du = numpy.array([mi for di, mi in changes], dtype=numpy.int64)
+            leaves = self._leaves()
+            delay = numpy.zeros(self.nbuckets, dtype=numpy.int64)
+            answers = []
+            start = 0
+            while start < len(changes):
+                bbk = bk[start:start + ADD_MANY_BLOCK]
+                bdu = du[start:start + ADD_MANY_BLOCK]
+                best, nkept = _block_maxima(leaves, bbk, bdu, MAX_DELAY_CELLS)
+                taken = len(best)
+                start += taken
+                answers.extend(numpy.maximum(best, 0).tolist())
+                delay[:] = 0
+                numpy.add.at(delay, bbk[:taken] - 1, bdu[:taken])
+                leaves += numpy.cumsum(delay)
+            self._apply_merged(changes)
+        # The ids of the tasks removed again within ''ops'' count too.
+        self._commit([(tid,) + tsk for tid, tsk in added.iteritems()], removed,
+                     [arg[0] for kind, arg in ops if kind == "ADD"])
+        return answers
+
+    def __contains__(self, task_id):
+        return task_id in self._tasks
+
+    def maxover(self):
+        ''' The minimum max overshoot of all tasks added so far. '''
+        if self._stale_max is not None:
+            maxover = self._stale_max
+        else:
+            maxover = self._segtree.max()
+        if maxover < 0:
+            maxover = 0
+        return maxover
+
+    def _probe_split(self, di):
+        ''' The max overshoot over deadlines before ''di'', and from ''di'' on
+        (by bucket, with a ''width''). '''
+        self._sync()
+        b = self._bucket(di)
+        return (self._segtree.query(1, b - 1),
+                self._segtree.query(b, self.nbuckets))
+
+    def probe(self, deadline, duration):
+        ''' The max overshoot if a task with ''deadline'' and ''duration'' were
+        added, without adding it. O(log(n)). '''
+        self._check_deadline(deadline)
+        before, after = self._probe_split(deadline)
+        # Only the new task and the deadlines from it on are delayed.
+        maxover = max(before, after + duration)
+        if maxover < 0:
+            maxover = 0
+        return maxover
+
+    def probe_many(self, deadlines, durations):
+        ''' probe() for each pair of ''deadlines'' and ''durations''. Candidates
+        sharing a deadline share the range max queries. '''
+        splits = {}
+        res = []
+        for di, mi in zip(deadlines, durations):
+            if di not in splits:
+                self._check_deadline(di)
+                splits[di] = self._probe_split(di)
+            before, after = splits[di]
+            maxover = max(before, after + mi)
+            res.append(maxover if maxover > 0 else 0)
+        return res
+
+    def max_admissible_duration(self, deadline, budget):
+        ''' The largest duration a new task with ''deadline'' can take without
+        the max overshoot exceeding ''budget'', or None if the current tasks
+        already overshoot by more than that. O(log(n)). '''
+        self._check_deadline(deadline)
+        before, after = self._probe_split(deadline)
+        # The new task delays everything from its deadline on by its duration,
+        # so the deadlines from it on leave budget - after for it.
+        if budget < 0 or before > budget or after > budget:
+            return None
+        return budget - after
+
+
+##
+# Offline block engine: the same answers as TaskScheduler, but computed a block
+# of about sqrt(n) tasks at a time with NumPy instead of one tree update per
+# task. The state between blocks is a single int64 array of leaves indexed by
+# rank, seeded with -deadline like TaskScheduler's segment tree; the tasks of a
+# block get their answers from _block_maxima() (see add_many() above), and the
+# block is then applied to the leaves with one running sum. That makes about
+# sqrt(n) passes of O(n) array operations, plus O(block * kept) per block.
+#
+# Without NumPy it falls back to TaskScheduler.
+#
+class BlockTaskScheduler(object):
+    def __init__(self, block=None):
+        self.block = block
+        self._deadlines = array('i')
+        self._durations = array('i')
+        self.ntasks = 0
+
+    def add(self, tsk):
+        ''' Each task ''tsk'' is a tuple of (task_index, deadline, duration);
+        task ids must follow the order in which the tasks are added. '''
+        self._deadlines.append(tsk[1])
+        self._durations.append(tsk[2])
+        self.ntasks += 1
+
+    def add_columns(self, deadlines, durations):
+        ''' Add the tasks given as columns ''deadlines'' and ''durations''. '''
+        self._deadlines.extend(deadlines)
+        self._durations.extend(durations)
+        self.ntasks += len(deadlines)
+
+    def prep(self):
+        ''' Rank the tasks and seed the leaves. '''
+        self._nsched = 0
+        if numpy is None:
+            self._fallback = TaskScheduler()
+            self._fallback.add_columns(self._deadlines, self._durations)
+            self._fallback.prep()
+            return
+        dl = numpy.frombuffer(self._deadlines, dtype=numpy.int32).astype(numpy.int64)
+        order = numpy.argsort(dl, kind="mergesort")
+        self._ranks = numpy.empty(self.ntasks, dtype=numpy.int64)
+        self._ranks[order] = numpy.arange(1, self.ntasks + 1)
+        self._leaves = -dl[order]
+        self._durs = numpy.frombuffer(self._durations, dtype=numpy.int32).astype(numpy.int64)
+
+    def sched(self, upto=None, runs=False):
+        ''' The answers for the tasks up to task id ''upto'' (all by default),
+        continuing from where the previous call stopped, or only their runs
+        with ''runs'', as TaskScheduler.sched(). '''
+        if upto is None:
+            upto = self.ntasks
+        if numpy is None:
+            return self._fallback.sched(upto, runs)
+        start = self._nsched
+        last = max(int(self._leaves.max()), 0) if start else 0
+        answers = self._sched(upto)
+        if runs:
+            return encode_runs(answers, start + 1, last)
+        return answers
+
+    def _sched(self, upto):
+        block = self.block or max(int(self.ntasks ** 0.5), 1)
+        leaves, answers = self._leaves, []
+        for start in xrange(self._nsched, upto, block):
+            stop = min(start + block, upto)
+            ranks, durs = self._ranks[start:stop], self._durs[start:stop]
+            best, nkept = _block_maxima(leaves, ranks, durs)
+            answers.extend(numpy.maximum(best, 0).tolist())
+            # Ranks are distinct, so the block's durations can simply be set.
+            delta = numpy.zeros(self.ntasks, dtype=numpy.int64)
+            delta[ranks - 1] = durs
+            leaves += delta.cumsum()
+        self._nsched = max(self._nsched, upto)
+        return answers
+
+
+##
+# Bulk I/O: the whole input is read and split in one go, and all the answers are
+# written with a single write. This is much cheaper than a raw_input() and a
+# print per task once there are a lot of tasks.
+#
+def read_tasks(stream):
+    ''' Read a whole input from ''stream''. Returns (ntasks, deadlines,
+    durations), where deadlines and durations are array('i') columns indexed
+    by task id - 1. '''
+    vals = array('i', map(int, stream.read().split()))
+    ntasks = vals[0] if vals else 0
+    if len(vals) < 2 * ntasks + 1:
+        raise ValueError("truncated input: %d tasks, but %d values follow"
+                         % (ntasks, len(vals) - 1))
+    return ntasks, vals[1:2 * ntasks + 1:2], vals[2:2 * ntasks + 2:2]
+
+def read_task_chunks(stream, chunk=1 << 16):
+    ''' Read an input from ''stream'' ''chunk'' tasks at a time. Returns the
+    number of tasks and an iterator over (deadlines, durations) array('i')
+    columns of the chunks. '''
+    ntasks = int(stream.readline())
+    def chunks():
+        left = ntasks
+        while left > 0:
+            vals = array('i', map(int, "".join(islice(stream, min(chunk, left))).split()))
+            if not vals:
+                raise ValueError("truncated input: %d of %d tasks missing" % (left, ntasks))
+            left -= len(vals) // 2
+            yield vals[0::2], vals[1::2]
+    return ntasks, chunks()
+
+def write_answers(stream, answers):
+    ''' Write ''answers'' one per line with a single write. '''
+    if answers:
+        stream.write("\n".join(map(str, answers)) + "\n")
+
+##
+# Run-length output: the answers never go down as tasks are added and often
+# stay the same for many steps, so instead of one line per task the runs format
+# has the number of answers T on the first line, then a "gap increase" line
+# for each step whose answer differs from the step before, counting from an
+# answer of 0 before step 1: the answer goes up by ''increase'' ''gap'' steps
+# after the previous such line, and stays there until the next one or step T.
+# Both numbers stay small even when the answers themselves are large.
+# decode_runs() expands it back to the classic format.
+#
+def encode_runs(answers, start=1, last=0):
+    ''' The (step, answer) runs of ''answers'', the answers from step
+    ''start'' on, after a step whose answer was ''last''. '''
+    runs = []
+    for step, maxover in enumerate(answers, start):
+        if maxover != last:
+            runs.append((step, maxover))
+            last = maxover
+    return runs
+
+def write_runs(stream, runs, prev=(0, 0)):
+    ''' Write the (step, answer) ''runs'' following the run ''prev''. Returns
+    the last run, to pass as ''prev'' when more runs of the same output follow.
+    The header line is up to the caller. '''
+    lines = []
+    pstep, pmaxover = prev
+    for step, maxover in runs:
+        lines.append("%d %d" % (step - pstep, maxover - pmaxover))
+        pstep, pmaxover = step, maxover
+    if lines:
+        stream.write("\n".join(lines) + "\n")
+    return pstep, pmaxover
+
+def decode_runs(src, dst):
+    ''' Expand the runs format read from stream ''src'' into one answer per
+    line on stream ''dst''. '''
+    ntasks = int(src.readline())
+    step, maxover = 0, 0
+    for line in src:
+        gap, increase = map(int, line.split())
+        dst.write("%d\n" % maxover * (gap - 1))
+        step += gap
+        maxover += increase
+        dst.write("%d\n" % maxover)
+    dst.write("%d\n" % maxover * (ntasks - step))
 
 ##
 # Test
 #
 if __name__ == "__main__":
+    import argparse
     import sys
-    # Get number of tasks
-    ntasks = int(raw_input())
-    #print ">>> %d tasks" % ntasks
-    tschedr = TaskScheduler()
-    for idx in xrange(1, ntasks + 1):
-        (di, mi) = raw_input().split()
-        newtask = (idx, int(di), int(mi))
-        #print ">>> %s" % (newtask)
-        tschedr.add(newtask)
+    parser = argparse.ArgumentParser(description="Task scheduling (see tasksched.py).")
+    parser.add_argument("--io", choices=("bulk", "lines"), default="bulk",
+                        help="read/write everything at once (bulk) or line by line (lines)")
+    parser.add_argument("--online", action="store_true",
+                        help="answer each task as soon as its line arrives")
+    parser.add_argument("--topk", type=int, default=0,
+                        help="also print the K most overshooting tasks as tid:overshoot")
+    parser.add_argument("--timing", action="store_true",
+                        help="report parse, prep, sched and emit times on stderr")
+    parser.add_argument("--taskfile", metavar="PATH",
+                        help="read the tasks from a binary task file (see taskfile.py) "
+                        "chunk by chunk instead of stdin")
+    parser.add_argument("--engine", choices=("tree", "block"), default="tree",
+                        help="TaskScheduler (tree), or BlockTaskScheduler (block), which "
+                        "works on blocks of tasks with NumPy")
+    parser.add_argument("--approx", type=int, default=0, metavar="WIDTH",
+                        help="approximate with deadline buckets WIDTH wide, in memory bounded "
+                        "by the number of buckets: each answer is at most WIDTH - 1 too high")
+    parser.add_argument("--output", choices=("lines", "runs"), default="lines",
+                        help="one answer per line, or only the changes as runs (see "
+                        "write_runs())")
+    parser.add_argument("--decode-runs", action="store_true",
+                        help="expand runs output read from stdin to one answer per line")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="count the work done by the trees and time each insert, and "
+                        "write the results as JSON to PATH ('-' for stderr)")
+    parser.add_argument("--stats-every", type=int, default=0, metavar="N",
+                        help="with --stats, also write a JSON line every N inserts")
+    args = parser.parse_args()
+    runs = args.output == "runs"
+    if runs and args.topk:
+        parser.error("--output runs cannot be combined with --topk")
+    if args.decode_runs:
+        decode_runs(sys.stdin, sys.stdout)
+        sys.exit(0)
+    if args.taskfile or args.approx:
+        unsupported = [opt for opt, used in (("--online", args.online), ("--topk", args.topk),
+                                             ("--stats", args.stats), ("--timing", args.timing),
+                                             ("--engine block", args.engine == "block"))
+                       if used]
+        if unsupported:
+            parser.error("--taskfile and --approx do not support %s" % ", ".join(unsupported))
+        # Stream the chunks through the online scheduler: memory stays bounded
+        # by its arrays over the deadline domain (or its buckets), not by the
+        # number of tasks.
+        if args.taskfile:
+            import taskfile
+            ntasks = taskfile.task_count(args.taskfile)
+            chunks = taskfile.iter_chunks(args.taskfile)
+        else:
+            ntasks, chunks = read_task_chunks(sys.stdin)
+        tschedr = OnlineTaskScheduler(keep_tasks=False, width=max(args.approx, 1))
+        if runs:
+            sys.stdout.write("%d\n" % ntasks)
+        prev = (0, 0)
+        for deadlines, durations in chunks:
+            answers = tschedr.add_many(deadlines, durations)
+            if runs:
+                prev = write_runs(sys.stdout, encode_runs(
+                    answers, tschedr.ntasks - len(answers) + 1, prev[1]), prev)
+            else:
+                write_answers(sys.stdout, answers)
+        sys.stdout.flush()
+        sys.exit(0)
+    if args.online:
+        unsupported = [opt for opt, used in (("--topk", args.topk), ("--stats", args.stats),
+                                             ("--timing", args.timing),
+                                             ("--engine block", args.engine == "block"))
+                       if used]
+        if unsupported:
+            parser.error("--online does not support %s" % ", ".join(unsupported))
+        # Answer each task as soon as its line arrives; with runs, a line only
+        # comes when the answer changes.
+        ntasks = int(sys.stdin.readline())
+        tschedr = OnlineTaskScheduler()
+        if runs:
+            sys.stdout.write("%d\n" % ntasks)
+            sys.stdout.flush()
+        prev = (0, 0)
+        for idx in xrange(1, ntasks + 1):
+            (di, mi) = sys.stdin.readline().split()
+            maxover = tschedr.add((idx, int(di), int(mi)))
+            if not runs:
+                print maxover
+                sys.stdout.flush()
+            elif maxover != prev[1]:
+                prev = write_runs(sys.stdout, [(idx, maxover)], prev)
+                sys.stdout.flush()
+        sys.exit(0)
+    stats = None
+    if args.stats:
+        statsout = sys.stderr if args.stats == "-" else open(args.stats, "w")
+        stats = instrument.Stats(args.stats_every, statsout)
+    t0 = time.time()
+    if args.engine == "block":
+        if args.topk or stats is not None:
+            parser.error("--engine block does not support --topk or --stats")
+        tschedr = BlockTaskScheduler()
+    else:
+        tschedr = TaskScheduler(topk=args.topk, stats=stats)
+    if args.io == "bulk":
+        ntasks, deadlines, durations = read_tasks(sys.stdin)
+        tschedr.add_columns(deadlines, durations)
+    else:
+        # Get number of tasks
+        ntasks = int(raw_input())
+        for idx in xrange(1, ntasks + 1):
+            (di, mi) = raw_input().split()
+            tschedr.add((idx, int(di), int(mi)))
+    t1 = time.time()
     tschedr.prep()
-    tschedr.sched()
+    t2 = time.time()
+    answers = tschedr.sched(runs=runs)
+    if args.topk:
+        answers = [" ".join([str(maxover)] + ["%d:%d" % t for t in top])
+                   for maxover, top in answers]
+    t3 = time.time()
+    if runs:
+        sys.stdout.write("%d\n" % ntasks)
+        write_runs(sys.stdout, answers)
+    elif args.io == "bulk":
+        write_answers(sys.stdout, answers)
+    else:
+        for maxover in answers:
+            print maxover
+    sys.stdout.flush()
+    t4 = time.time()
+    if stats is not None:
+        stats.dump(statsout)
+        statsout.flush()
+    if args.timing:
+        sys.stderr.write("parse %.3fs prep %.3fs sched %.3fs emit %.3fs\n" %
+                         (t1 - t0, t2 - t1, t3 - t2, t4 - t3))
@@ -0,0 +1,556 @@
+##
+# Differential fuzzer for the task schedulers.
+#
+# Every engine (see ENGINES) is run on seeded random cases and its answers are
+# compared with those of oracle(), an offline reference that shares no code
+# with the engines and takes O(n log(n)), so that many cases can be checked
+# in the time the naive tasksched.py spends on a few. The naive solver is an
+# engine like the others, run on the small cases only (--naive-max). The
+# mixed engines (online-mixed, fast-clock) also remove, update, batch, probe,
+# add tasks after prep(), advance the clock and snapshot between the tasks of
+# the case, and check those operations themselves (see below).
+#
+# The oracle works on deadlines rather than on ranks. The answer for a prefix
+# of the tasks is max(0, max over deadlines d of S(d) - d), where S(d) is the
+# total duration of the tasks due by d. Over the distinct deadlines in order,
+# that is a maximum prefix sum: a tree whose nodes hold the total duration of
+# their deadlines and their best S - d relative to their own start combines
+# as best = max(left.best, left.sum + right.best), so each task is a single
+# point update, with no lazy range adds (OracleTree, which takes tasks out
+# again just as well).
+#
+# On a mismatch (or an exception) the failing case is shrunk: it is cut after
+# the first wrong answer, since the answers of a prefix depend on that prefix
+# only, then tasks are dropped in halving chunks and deadlines and durations
+# lowered, as long as the engine still fails. The shrunk case is printed in
+# the usual input format (see tasksched.py) with the expected and the actual
+# answer at the first step where they differ.
+#
+# An engine is a function taking the deadlines and the durations as lists and
+# returning the list of answers. Besides the names in ENGINES, --engines takes
+# module.function for an engine defined elsewhere, e.g. mymodule.run_mine.
+#
+# Usage: python tasksched_fuzz.py [--cases N] [--seed S] [--max-tasks N]
+#                                 [--engines a,b,...] [--jobs J]
+#
+import bisect
+import collections
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+import tasksched
+import tasksched_fast
+import tasksched_hackrank
+import tasksched_tester
+
+class OracleTree(object):
+    ''' The tree of oracle() over the deadlines ''keys'' (sorted): tasks go
+    in and out in O(log(n)) each. '''
+    def __init__(self, keys):
+        self.slot = dict((d, i) for i, d in enumerate(keys))
+        cap = 1
+        while cap < len(self.slot):
+            cap <<= 1
+        self.cap = cap
+        self.counts = [0] * cap
+        self.sums = [0] * (2 * cap)
+        self.best = [float("-inf")] * (2 * cap)
+
+    def add(self, di, mi, count=1):
+        ''' Add ''count'' tasks taking ''mi'' in all with deadline ''di'' (a
+        negative ''count'' and ''mi'' take them out again). '''
+        sums, best = self.sums, self.best
+        i = self.slot[di]
+        self.counts[i] += count
+        p = self.cap + i
+        sums[p] += mi
+        best[p] = sums[p] - di if self.counts[i] else float("-inf")
+        p >>= 1
+        while p:
+            l, r = 2 * p, 2 * p + 1
+            sums[p] = sums[l] + sums[r]
+            best[p] = max(best[l], sums[l] + best[r])
+            p >>= 1
+
+    def answer(self, start=0):
+        ''' The answer for the tasks in the tree, with the schedule starting
+        at ''start''. '''
+        return max(self.best[1] + start, 0)
+
+def oracle(deadlines, durations):
+    ''' The answers for every prefix of the tasks, computed on a tree of
+    maximum prefix sums over the distinct deadlines (see above). '''
+    tree = OracleTree(sorted(set(deadlines)))
+    answers = []
+    for di, mi in zip(deadlines, durations):
+        tree.add(di, mi)
+        answers.append(tree.answer())
+    return answers
+
+##
+# Engines.
+#
+def run_naive(deadlines, durations):
+    tasks = []
+    answers = []
+    for idx, (di, mi) in enumerate(zip(deadlines, durations)):
+        tasks.append((idx + 1, di, mi))
+        maxover, sched = tasksched.task_sched(tasks)
+        answers.append(max(maxover, 0))
+    return answers
+
+def _fast(tschedr, deadlines, durations):
+    tschedr.add_columns(deadlines, durations)
+    tschedr.prep()
+    return tschedr
+
+def run_fast(deadlines, durations):
+    return _fast(tasksched_fast.TaskScheduler(), deadlines, durations).sched()
+
+def run_fast_split(deadlines, durations):
+    ''' TaskScheduler.sched() resumed in three calls. '''
+    tschedr = _fast(tasksched_fast.TaskScheduler(), deadlines, durations)
+    n = len(deadlines)
+    return tschedr.sched(n // 3) + tschedr.sched(2 * n // 3) + tschedr.sched()
+
+def run_fast_runs(deadlines, durations):
+    ''' TaskScheduler.sched(runs=True), expanded back to every answer. '''
+    runs = _fast(tasksched_fast.TaskScheduler(), deadlines, durations).sched(runs=True)
+    answers = []
+    for step, maxover in runs:
+        answers.extend([answers[-1] if answers else 0] * (step - 1 - len(answers)))
+        answers.append(maxover)
+    answers.extend([answers[-1] if answers else 0] * (len(deadlines) - len(answers)))
+    return answers
+
+def run_fast_persistent(deadlines, durations):
+    tschedr = tasksched_fast.TaskScheduler(persistent=True)
+    return _fast(tschedr, deadlines, durations).sched()
+
+def run_fast_topk(deadlines, durations):
+    tschedr = tasksched_fast.TaskScheduler(topk=2)
+    return [maxover for maxover, top in _fast(tschedr, deadlines, durations).sched()]
+
+def run_block(deadlines, durations):
+    tschedr = tasksched_fast.BlockTaskScheduler()
+    tschedr.add_columns(deadlines, durations)
+    tschedr.prep()
+    return tschedr.sched()
+
+def run_hackrank(deadlines, durations):
+    tschedr = tasksched_hackrank.TaskScheduler()
+    for idx, (di, mi) in enumerate(zip(deadlines, durations)):
+        tschedr.add((idx + 1, di, mi))
+    tschedr.prep()
+    return tschedr.sched()
+
+def run_online(deadlines, durations):
+    ''' OnlineTaskScheduler.add(), one task at a time. '''
+    tschedr = tasksched_fast.OnlineTaskScheduler(max(deadlines))
+    return [tschedr.add((idx + 1, di, mi))
+            for idx, (di, mi) in enumerate(zip(deadlines, durations))]
+
+def run_online_many(deadlines, durations):
+    ''' OnlineTaskScheduler.add_many() without keeping the tasks, i.e. the
+    path of --taskfile and --approx 1. '''
+    tschedr = tasksched_fast.OnlineTaskScheduler(max(deadlines), keep_tasks=False)
+    return tschedr.add_many(deadlines, durations)
+
+
+##
+# Mixed engines: the case tasks go in one per step as above, so the answers
+# can still be checked against the prefixes, but each step also runs a few
+# other operations, chosen by a generator seeded with the step alone (so that
+# a shrunk case still runs the same operations at its first steps). Those are
+# checked by the engine itself against an OracleTree of the tasks live at the
+# time, and a mismatch is raised as an AssertionError naming the operation.
+#
+def _expect(what, step, want, got):
+    if want != got:
+        raise AssertionError("%s at step %d: expected %s, got %s" % (what, step, want, got))
+
+def run_online_mixed(deadlines, durations):
+    ''' OnlineTaskScheduler with decoy tasks around the case tasks: add(),
+    add_many() with its default ids, remove(), update(), apply_batch() and
+    apply_ops() change the tasks, and probe() and max_admissible_duration()
+    ask about them. The decoys are gone again whenever a case task goes in. '''
+    max_di = max(deadlines)
+    tschedr = tasksched_fast.OnlineTaskScheduler(max_di)
+    tree = OracleTree(xrange(1, max_di + 1))
+    live = {}  # task id => (deadline, duration)
+    decoys = []
+    nextid = [1]  # past every id added so far, as add_many() counts on from
+
+    def new_id(gap=0):
+        tid = nextid[0] + gap
+        nextid[0] = tid + 1
+        return tid
+
+    def put(tid, di, mi):
+        live[tid] = (di, mi)
+        tree.add(di, mi)
+
+    def drop(tid):
+        di, mi = live.pop(tid)
+        tree.add(di, -mi, -1)
+
+    def answer_with(di, mi):
+        # The answer if a task (di, mi) were added.
+        tree.add(di, mi)
+        answer = tree.answer()
+        tree.add(di, -mi, -1)
+        return answer
+
+    answers = []
+    for idx, (di, mi) in enumerate(zip(deadlines, durations)):
+        step = idx + 1
+        rng = random.Random(step)
+        how = rng.randrange(4)
+        if how == 2:
+            tid = new_id(rng.randrange(3))
+            for dec in decoys:
+                drop(dec)
+            put(tid, di, mi)
+            answers.append(tschedr.apply_batch([(tid, di, mi)], decoys))
+            decoys = []
+        elif how == 3:
+            # Drop the decoys, add the case task, then add and remove a decoy.
+            dec = (new_id(), rng.randint(1, max_di), rng.randint(0, 10))
+            ops = [("REMOVE", tid) for tid in decoys]
+            ops += [("ADD", (new_id(), di, mi)), ("ADD", dec), ("QUERY", None),
+                    ("REMOVE", dec[0])]
+            want = []
+            for kind, arg in ops:
+                if kind == "ADD":
+                    put(*arg)
+                elif kind == "REMOVE":
+                    drop(arg)
+                want.append(tree.answer())
+            got = tschedr.apply_ops(ops)
+            _expect("apply_ops()", step, want, got)
+            answers.append(got[len(decoys)])
+            decoys = []
+        else:
+            while decoys:
+                dec = decoys.pop(rng.randrange(len(decoys)))
+                drop(dec)
+                _expect("remove(%d)" % dec, step, tree.answer(), tschedr.remove(dec))
+            if how == 0:
+                tid = new_id(rng.randrange(3))
+                answers.append(tschedr.add((tid, di, mi)))
+            else:
+                tid = new_id()
+                answers.append(tschedr.add_many([di], [mi])[0])
+            put(tid, di, mi)
+
+        for i in xrange(rng.randrange(4)):
+            op = rng.randrange(6)
+            dd, dm = rng.randint(1, max_di), rng.randint(0, 10)
+            if op == 0:
+                tid = new_id(rng.randrange(3))
+                put(tid, dd, dm)
+                decoys.append(tid)
+                _expect("add()", step, tree.answer(), tschedr.add((tid, dd, dm)))
+            elif op == 1:
+                dls = [rng.randint(1, max_di) for j in xrange(rng.randint(1, 3))]
+                want = []
+                for dl in dls:
+                    tid = new_id()
+                    put(tid, dl, dm)
+                    decoys.append(tid)
+                    want.append(tree.answer())
+                _expect("add_many()", step, want, tschedr.add_many(dls, [dm] * len(dls)))
+            elif op == 2 and decoys:
+                tid = rng.choice(decoys)
+                drop(tid)
+                put(tid, dd, dm)
+                _expect("update(%d)" % tid, step, tree.answer(), tschedr.update(tid, dd, dm))
+            elif op == 3:
+                _expect("probe(%d, %d)" % (dd, dm), step, answer_with(dd, dm),
+                        tschedr.probe(dd, dm))
+            elif op == 4:
+                budget = tree.answer() + rng.randint(-2, 10)
+                got = tschedr.max_admissible_duration(dd, budget)
+                # The answer only grows with the duration, so the largest one
+                # within the budget is the one just before it is exceeded.
+                if got is None:
+                    ok = budget < 0 or answer_with(dd, 0) > budget
+                else:
+                    ok = got >= 0 and answer_with(dd, got) <= budget < answer_with(dd, got + 1)
+                if not ok:
+                    raise AssertionError("max_admissible_duration(%d, %d) at step %d: got %s"
+                                         % (dd, budget, step, got))
+            else:
+                _expect("maxover()", step, tree.answer(), tschedr.maxover())
+                _expect("ntasks", step, len(live), tschedr.ntasks)
+    return answers
+
+def run_fast_clock(deadlines, durations):
+    ''' TaskScheduler.sched() one task per step, with advance() moving the
+    clock and save()/load() round trips in between. Only a prefix of the
+    tasks is there for prep(): the others are added one by one just before
+    they are scheduled. The answers after the clock first runs are checked
+    within, against the retired max and the live tasks scheduled from the
+    end of the retired work on; the ones returned are those sched() gave
+    before that. '''
+    n = len(deadlines)
+    nprep = random.Random(n).choice([n, 0, n // 2, n // 5])
+    tschedr = _fast(tasksched_fast.TaskScheduler(), deadlines[:nprep], durations[:nprep])
+    tree = OracleTree(sorted(set(deadlines)))
+    live = []  # (deadline, task id) of the tasks scheduled and not retired
+    start, retired_max = 0, 0
+    clocked = False
+    answers = []
+    fd, path = tempfile.mkstemp(suffix=".tsched")
+    os.close(fd)
+    try:
+        for idx, (di, mi) in enumerate(zip(deadlines, durations)):
+            step = idx + 1
+            rng = random.Random(step)
+            if idx >= nprep:
+                tschedr.add((step, di, mi))
+            got = tschedr.sched(step)[0]
+            tree.add(di, mi)
+            bisect.insort(live, (di, step))
+            if clocked:
+                _expect("sched()", step, max(retired_max, tree.answer(start)), got)
+            else:
+                answers.append(got)
+            if rng.random() < 0.3:
+                # The live schedule runs in deadline order, ties by id.
+                ends = []
+                end = start
+                for d, tid in live:
+                    end += durations[tid - 1]
+                    ends.append(end)
+                now = start + rng.randint(-1, end - start + 2)
+                nretire = sum(1 for end in ends if end <= now)
+                for i in xrange(nretire):
+                    d, tid = live[i]
+                    retired_max = max(retired_max, ends[i] - d)
+                    tree.add(d, -durations[tid - 1], -1)
+                    start = ends[i]
+                del live[:nretire]
+                if not live and now > start:
+                    start = now
+                _expect("advance(%d)" % now, step, nretire, tschedr.advance(now))
+                clocked = True
+                if live:
+                    i = rng.randrange(len(live))
+                    end = start + sum(durations[tid - 1] for d, tid in live[:i + 1])
+                    _expect("completion_time(%d)" % live[i][1], step, end,
+                            tschedr.completion_time(live[i][1]))
+                    view, end = [], start
+                    for d, tid in live:
+                        view.append((tid, end, end + durations[tid - 1]))
+                        end += durations[tid - 1]
+                    _expect("schedule()", step, view, list(tschedr.schedule()))
+                    # The first task in the schedule on ties.
+                    over, i = max((et - d, -i) for i, ((d, _), (_, _, et))
+                                  in enumerate(zip(live, view)))
+                    _expect("critical_task()", step, (live[-i][1], over) if over >= 0 else None,
+                            tschedr.critical_task())
+            if rng.random() < 0.2:
+                tschedr.save(path)
+                tschedr = tasksched_fast.TaskScheduler.load(path)
+    finally:
+        os.remove(path)
+    # The steps after the clock first ran were checked above.
+    return answers + oracle(deadlines, durations)[len(answers):]
+
+ENGINES = collections.OrderedDict([
+    ("naive", run_naive),
+    ("fast", run_fast),
+    ("fast-split", run_fast_split),
+    ("fast-runs", run_fast_runs),
+    ("fast-persistent", run_fast_persistent),
+    ("fast-topk", run_fast_topk),
+    ("block", run_block),
+    ("hackrank", run_hackrank),
+    ("online", run_online),
+    ("online-many", run_online_many),
+    ("online-mixed", run_online_mixed),
+    ("fast-clock", run_fast_clock),
+])
+
+def get_engine(name):
+    ''' The engine called ''name'' in ENGINES, or the function ''name'' given
+    as module.function. '''
+    if name in ENGINES:
+        return ENGINES[name]
+    modname, _, funcname = name.rpartition(".")
+    if not modname:
+        raise ValueError("unknown engine %s" % name)
+    return getattr(__import__(modname, fromlist=[funcname]), funcname)
+
+
+##
+# Cases, checks and shrinking.
+#
+def gen_case(seed, max_tasks):
+    ''' The case for ''seed'': (deadlines, durations) lists of up to
+    ''max_tasks'' tasks. Sizes are log-uniform, and the deadline and
+    duration ranges are often narrow, so that ties are common. '''
+    rng = random.Random(seed)
+    ntasks = int(max_tasks ** rng.random())
+    max_di = rng.choice([1, 3, 10, ntasks, 100, 1000])
+    if rng.random() < 0.02:
+        # Rarely, as the online engines pay for the whole deadline domain.
+        max_di = tasksched_tester.max_di
+    max_mi = rng.choice([1, 10, tasksched_tester.max_mi])
+    deadlines = [rng.randint(1, max_di) for i in xrange(ntasks)]
+    durations = [rng.randint(1, max_mi) for i in xrange(ntasks)]
+    order = rng.random()
+    if order < 0.1:
+        deadlines.sort()
+    elif order < 0.2:
+        deadlines.sort(reverse=True)
+    return deadlines, durations
+
+def check(engine, deadlines, durations, expected=None):
+    ''' Run ''engine'' on a case. Returns None if its answers are those of
+    the oracle, else (step, expected answer, answer) for the first step
+    that differs, or (None, None, error) if it raised. '''
+    if expected is None:
+        expected = oracle(deadlines, durations)
+    try:
+        answers = list(engine(list(deadlines), list(durations)))
+    except Exception as e:
+        return (None, None, "%s: %s" % (type(e).__name__, e))
+    for step, (want, got) in enumerate(zip(expected, answers), 1):
+        if want != got:
+            return (step, want, got)
+    if len(answers) != len(expected):
+        step = min(len(answers), len(expected)) + 1
+        return (step, "%d answers" % len(expected), "%d answers" % len(answers))
+    return None
+
+def shrink(engine, deadlines, durations):
+    ''' A case as small as can be found on which ''engine'' still fails, from
+    the failing case (''deadlines'', ''durations''). Returns the case and
+    the failure check() reports for it. '''
+    best = [list(deadlines), list(durations), check(engine, deadlines, durations)]
+
+    def attempt(dl, du):
+        # Keep the case (dl, du) if the engine still fails on it.
+        failure = check(engine, dl, du) if dl else None
+        if failure is None:
+            return False
+        step = failure[0]
+        if step is not None:
+            # The answers of a prefix depend on that prefix only.
+            dl, du = dl[:step], du[:step]
+        best[:] = [dl, du, failure]
+        return True
+
+    attempt(best[0], best[1])
+    changed = True
+    while changed:
+        changed = False
+        chunk = len(best[0]) // 2
+        while chunk:
+            i = 0
+            while i < len(best[0]):
+                dl, du = best[0], best[1]
+                if attempt(dl[:i] + dl[i + chunk:], du[:i] + du[i + chunk:]):
+                    changed = True
+                else:
+                    i += chunk
+            chunk //= 2
+        for col in (0, 1):
+            i = 0
+            while i < len(best[col]):
+                val = best[col][i]
+                for smaller in sorted(set([1, val // 2, val - 1])):
+                    if not 1 <= smaller < val:
+                        continue
+                    case = [best[0][:], best[1][:]]
+                    case[col][i] = smaller
+                    if attempt(*case):
+                        changed = True
+                        break
+                i += 1
+    return (best[0], best[1]), best[2]
+
+def fuzz_seeds(names, seeds, max_tasks, naive_max):
+    ''' Check the engines ''names'' on the cases of ''seeds''. Returns the
+    number of cases and of checks run, and the (seed, engine name) of the
+    first failure, or None. '''
+    engines = [(name, get_engine(name)) for name in names]
+    ncases, nchecks = 0, 0
+    for seed in seeds:
+        ncases += 1
+        deadlines, durations = gen_case(seed, max_tasks)
+        if not deadlines:
+            continue
+        expected = oracle(deadlines, durations)
+        for name, engine in engines:
+            if name == "naive" and len(deadlines) > naive_max:
+                continue
+            nchecks += 1
+            if check(engine, deadlines, durations, expected) is not None:
+                return ncases, nchecks, (seed, name)
+    return ncases, nchecks, None
+
+def _fuzz_seeds(args):
+    return fuzz_seeds(*args)
+
+def report(stream, seed, name, case, failure):
+    deadlines, durations = case
+    step, want, got = failure
+    stream.write("FAIL engine %s, seed %d, shrunk to %d tasks:\n" % (name, seed, len(deadlines)))
+    stream.write(tasksched_tester.format_case(deadlines, durations))
+    if step is None:
+        stream.write("raised %s\n" % got)
+    else:
+        stream.write("step %d: expected %s, got %s\n" % (step, want, got))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the task schedulers.")
+    parser.add_argument("--cases", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first case")
+    parser.add_argument("--max-tasks", type=int, default=100)
+    parser.add_argument("--engines", default=",".join(ENGINES),
+                        help="comma separated engines, names from ENGINES or "
+                        "module.function (default: all)")
+    parser.add_argument("--naive-max", type=int, default=30,
+                        help="run the O(n^2 log(n)) naive engine up to this many tasks")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--batch", type=int, default=1000, help="cases per work unit")
+    args = parser.parse_args()
+
+    names = args.engines.split(",")
+    for name in names:
+        get_engine(name)
+    units = [(names, xrange(lo, min(lo + args.batch, args.seed + args.cases)),
+              args.max_tasks, args.naive_max)
+             for lo in xrange(args.seed, args.seed + args.cases, args.batch)]
+    t0 = time.time()
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap(_fuzz_seeds, units)
+    else:
+        results = (fuzz_seeds(*unit) for unit in units)
+    ncases, nchecks = 0, 0
+    failed = None
+    for n, m, failed in results:
+        ncases += n
+        nchecks += m
+        if failed:
+            break
+    if args.jobs > 1:
+        pool.terminate()
+    elapsed = time.time() - t0
+    sys.stderr.write("%d cases, %d checks in %.1fs (%.0f cases/s)\n" %
+                     (ncases, nchecks, elapsed, ncases / elapsed if elapsed else 0))
+    if failed:
+        seed, name = failed
+        case, failure = shrink(get_engine(name), *gen_case(seed, args.max_tasks))
+        report(sys.stdout, seed, name, case, failure)
+        sys.exit(1)
@@ -1,4 +1,7 @@
 #import cProfile
+import sys
+import time
+from array import array
 
 class SEGTreeNode(object):
     def __init__(self, leftchild, rightchild, index, valfunc):
@@ -118,8 +121,13 @@ class BinaryIndexedTree(object):
 ##
 # See tasksched.py for problem description and algorithm.
 #
+# ''stats'' is an optional instrument.Stats (see instrument.py) that counts the
+# bitree calls and the valfunc cache hits, and times each insert. This file is
+# meant to be submitted on its own, so instrument is only imported when used.
+#
 class TaskScheduler(object):
-    def __init__(self):
+    def __init__(self, stats=None):
+        self.stats = stats
         self._tasks_by_id = []
         self._tasks_by_rank = []
         self._id2rank_map = []
@@ -143,10 +151,17 @@ class TaskScheduler(object):
             self._id2rank_map[t[0] - 1] = i
         # initialize trees
         self._bitree = BinaryIndexedTree(self.ntasks)
-        self._segtree = segtree_build_topdown(1, ntasks, negative_infinity_func)
+        self._segtree = segtree_build_topdown(1, self.ntasks, negative_infinity_func)
+        if self.stats is not None:
+            import instrument
+            instrument.instrument(self._bitree, self.stats)
 
     def sched(self):
+        answers = []
+        stats = self.stats
         for idx in xrange(1, self.ntasks + 1):
+            if stats is not None:
+                t0 = time.time()
             rank = self._id2rank_map[idx - 1] + 1
             di, mi = self._tasks_by_rank[rank - 1][1:]
             # Now insert this task by its rank into the bitree and segtree
@@ -173,25 +188,85 @@ class TaskScheduler(object):
                     res = self._bitree.sum(node_rank) - node_di
                 valcache[node_rank] = res
                 return res
+            if stats is not None:
+                valfunc = stats.cached(valfunc, valcache)
             segtree_update(self._segtree, rank, valfunc)
             maxrank = self._segtree.maxnode.interval[0]
             maxover = valfunc(maxrank)
             if maxover < 0:
                 maxover = 0
-            print maxover
+            answers.append(maxover)
+            if stats is not None:
+                stats.insert_done(time.time() - t0)
+        return answers
+
+
+##
+# Bulk I/O: read and split the whole input at once, write all answers at once.
+#
+def read_tasks(stream):
+    vals = array('i', map(int, stream.read().split()))
+    ntasks = vals[0] if vals else 0
+    if len(vals) < 2 * ntasks + 1:
+        raise ValueError("truncated input: %d tasks, but %d values follow"
+                         % (ntasks, len(vals) - 1))
+    return ntasks, vals[1:2 * ntasks + 1:2], vals[2:2 * ntasks + 2:2]
+
+def write_answers(stream, answers):
+    if answers:
+        stream.write("\n".join(map(str, answers)) + "\n")
 
 
 ##
 # Test
 #
 if __name__ == "__main__":
-    # Get number of tasks
-    ntasks = int(raw_input())
-    tschedr = TaskScheduler()
-    for idx in xrange(1, ntasks + 1):
-        (di, mi) = raw_input().split()
-        newtask = (idx, int(di), int(mi))
-        tschedr.add(newtask)
+    import argparse
+    parser = argparse.ArgumentParser(description="Task scheduling (see tasksched.py).")
+    parser.add_argument("--io", choices=("bulk", "lines"), default="bulk",
+                        help="read/write everything at once (bulk) or line by line (lines)")
+    parser.add_argument("--timing", action="store_true",
+                        help="report parse, prep, sched and emit times on stderr")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="count the bitree calls and the valfunc cache hits and time "
+                        "each insert, and write the results as JSON to PATH ('-' for stderr)")
+    parser.add_argument("--stats-every", type=int, default=0, metavar="N",
+                        help="with --stats, also write a JSON line every N inserts")
+    args = parser.parse_args()
+    lines = args.io == "lines"
+    stats = None
+    if args.stats:
+        import instrument
+        statsout = sys.stderr if args.stats == "-" else open(args.stats, "w")
+        stats = instrument.Stats(args.stats_every, statsout)
+    t0 = time.time()
+    tschedr = TaskScheduler(stats)
+    if lines:
+        # Get number of tasks
+        ntasks = int(raw_input())
+        for idx in xrange(1, ntasks + 1):
+            (di, mi) = raw_input().split()
+            tschedr.add((idx, int(di), int(mi)))
+    else:
+        ntasks, deadlines, durations = read_tasks(sys.stdin)
+        for idx in xrange(ntasks):
+            tschedr.add((idx + 1, deadlines[idx], durations[idx]))
+    t1 = time.time()
     tschedr.prep()
-    tschedr.sched()
+    t2 = time.time()
+    answers = tschedr.sched()
     #cProfile.run('tschedr.sched()', 'xprof.txt')
+    t3 = time.time()
+    if lines:
+        for maxover in answers:
+            print maxover
+    else:
+        write_answers(sys.stdout, answers)
+    sys.stdout.flush()
+    t4 = time.time()
+    if stats is not None:
+        stats.dump(statsout)
+        statsout.flush()
+    if args.timing:
+        sys.stderr.write("parse %.3fs prep %.3fs sched %.3fs emit %.3fs\n" %
+                         (t1 - t0, t2 - t1, t3 - t2, t4 - t3))
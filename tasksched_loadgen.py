@@ -0,0 +1,128 @@
+##
+# Load generator for tasksched_server.py.
+#
+# Sends commands at a fixed target rate, spread over several connections, and
+# reports the reply latency percentiles. The load is open loop: requests are
+# sent on schedule whether or not the earlier ones have been answered, so a
+# server that falls behind shows up as growing latencies rather than as a
+# lower request rate. Deadlines and durations are drawn as in
+# tasksched_tester.gen_tasks; REMOVE picks one of the ids the connection got
+# back from its own ADDs.
+#
+import asynchat
+import asyncore
+import collections
+import random
+import socket
+import time
+
+import tasksched_server
+import tasksched_tester
+
+class Client(asynchat.async_chat):
+    def __init__(self, host, port, session, rng, cmap):
+        asynchat.async_chat.__init__(self, map=cmap)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connect((host, port))
+        self.set_terminator("\n")
+        self.rng = rng
+        self.inbuf = []
+        self.sent = collections.deque()  # (command, send time), oldest first
+        self.ids = []
+        self.latencies = []
+        self.errors = 0
+        self.send_command("SESSION %s" % session, record=False)
+
+    def handle_connect(self):
+        pass
+
+    def send_command(self, cmd, record=True):
+        self.sent.append((cmd if record else None, time.time()))
+        self.push(cmd + "\n")
+
+    def send_random(self, mix):
+        ''' Send a command drawn from ''mix'', the (add, remove, query) weights. '''
+        x = self.rng.random() * sum(mix)
+        if x < mix[0] or not self.ids:
+            self.send_command("ADD %d %d" % (self.rng.randint(1, tasksched_tester.max_di),
+                                             self.rng.randint(1, tasksched_tester.max_mi)))
+        elif x < mix[0] + mix[1]:
+            tid = self.ids.pop(self.rng.randrange(len(self.ids)))
+            self.send_command("REMOVE %d" % tid)
+        else:
+            self.send_command("QUERY")
+
+    def collect_incoming_data(self, data):
+        self.inbuf.append(data)
+
+    def found_terminator(self):
+        line = "".join(self.inbuf)
+        self.inbuf = []
+        cmd, t = self.sent.popleft()
+        if cmd is None:
+            return
+        self.latencies.append(time.time() - t)
+        if line.startswith("ERR"):
+            self.errors += 1
+        elif cmd.startswith("ADD"):
+            self.ids.append(int(line.split()[0]))
+
+def percentile(values, q):
+    ''' The ''q'' quantile (0..1) of the sorted list ''values'', nearest rank. '''
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run(host, port, rate, duration, nconns=4, session="loadgen", mix=(8, 1, 1), seed=None):
+    ''' Send ''rate'' commands per second for ''duration'' seconds over
+    ''nconns'' connections, then wait for the outstanding replies. Returns a
+    dict of the counts, the achieved rate and the latency percentiles in
+    milliseconds. '''
+    rng = random.Random(seed)
+    cmap = {}
+    clients = [Client(host, port, session, random.Random(rng.random()), cmap)
+               for i in xrange(nconns)]
+    start = time.time()
+    nsent = 0
+    while True:
+        now = time.time()
+        due = min(int((now - start) * rate), int(duration * rate))
+        while nsent < due:
+            clients[nsent % nconns].send_random(mix)
+            nsent += 1
+        if nsent >= duration * rate:
+            break
+        asyncore.loop(min(0.01, (nsent + 1) / float(rate) - (now - start)), map=cmap, count=1)
+    end = time.time()
+    deadline = end + 10.0
+    while any(c.sent for c in clients) and time.time() < deadline:
+        asyncore.loop(0.01, map=cmap, count=1)
+    for c in clients:
+        c.close()
+    latencies = sorted(l for c in clients for l in c.latencies)
+    return {"sent": nsent, "answered": len(latencies),
+            "errors": sum(c.errors for c in clients),
+            "rate": nsent / (end - start),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": percentile(latencies, 1.0) * 1000}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Load test tasksched_server.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=tasksched_server.PORT)
+    parser.add_argument("--rate", type=float, default=1000, help="commands per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--session", default="loadgen")
+    parser.add_argument("--mix", default="8,1,1",
+                        help="relative weights of ADD, REMOVE and QUERY (default 8,1,1)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    res = run(args.host, args.port, args.rate, args.duration, args.connections,
+              args.session, tuple(map(float, args.mix.split(","))), args.seed)
+    print ("sent %(sent)d answered %(answered)d errors %(errors)d rate %(rate).0f/s "
+           "p50 %(p50_ms).2fms p99 %(p99_ms).2fms max %(max_ms).2fms" % res)
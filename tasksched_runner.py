@@ -0,0 +1,108 @@
+##
+# Solves many independent task lists on a process pool, reusing the
+# TaskScheduler from tasksched_fast.py instead of paying for a fresh
+# interpreter per case.
+#
+# The input is either a directory holding one case per file (in the usual
+# format, see tasksched.py), or one file with the cases concatenated back to
+# back: T, then T lines of "Di Mi", then the next case's T, and so on. Cases
+# are handed to the pool largest first, so a big case submitted late cannot
+# leave the other workers idle at the end, and the answers are written in
+# input order as soon as every case before them is done: to stdout, one case
+# after another, or with --outdir to <case name>.out files.
+#
+import multiprocessing
+import os
+import sys
+from array import array
+
+import tasksched_fast
+
+def _solve(deadlines, durations):
+    tschedr = tasksched_fast.TaskScheduler()
+    tschedr.add_columns(deadlines, durations)
+    tschedr.prep()
+    answers = tschedr.sched()
+    if not answers:
+        return ""
+    return "\n".join(map(str, answers)) + "\n"
+
+def solve_file(path):
+    ''' The answers of the case in file ''path'', as text. '''
+    with open(path) as f:
+        ntasks, deadlines, durations = tasksched_fast.read_tasks(f)
+    return _solve(deadlines, durations)
+
+def solve_columns(deadlines, durations):
+    ''' The answers of the case given as the raw bytes of array('i') columns. '''
+    dl, du = array('i'), array('i')
+    dl.fromstring(deadlines)
+    du.fromstring(durations)
+    return _solve(dl, du)
+
+def split_cases(stream):
+    ''' Split concatenated cases in ''stream''. Returns a list of
+    (deadlines, durations) array('i') columns. '''
+    vals = array('i', map(int, stream.read().split()))
+    cases = []
+    pos = 0
+    while pos < len(vals):
+        ntasks = vals[pos]
+        cases.append((vals[pos + 1:pos + 2 * ntasks + 1:2],
+                      vals[pos + 2:pos + 2 * ntasks + 2:2]))
+        pos += 2 * ntasks + 1
+    return cases
+
+def run(jobs, names, sizes, func, args):
+    ''' Run func(*args[i]) for every case on a pool of ''jobs'' processes,
+    largest ''sizes'' first. Yields (name, answers) in input order. '''
+    pool = multiprocessing.Pool(jobs)
+    try:
+        order = sorted(xrange(len(names)), key=lambda i: -sizes[i])
+        results = [None] * len(names)
+        for i in order:
+            results[i] = pool.apply_async(func, args[i])
+        for name, res in zip(names, results):
+            yield name, res.get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Solve many task lists in parallel.")
+    parser.add_argument("input", help="a directory of cases, or a file of concatenated "
+                        "cases ('-' for stdin)")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--outdir", help="write each case's answers to <case name>.out here")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        names = sorted(os.listdir(args.input))
+        paths = [os.path.join(args.input, name) for name in names]
+        sizes = [os.path.getsize(path) for path in paths]
+        func, fargs = solve_file, [(path,) for path in paths]
+    else:
+        if args.input == "-":
+            cases = split_cases(sys.stdin)
+        else:
+            with open(args.input) as f:
+                cases = split_cases(f)
+        names = ["case%d" % (i + 1) for i in xrange(len(cases))]
+        sizes = [len(dl) for dl, du in cases]
+        func = solve_columns
+        fargs = [(dl.tostring(), du.tostring()) for dl, du in cases]
+        del cases
+
+    if args.outdir and not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    for name, answers in run(args.jobs, names, sizes, func, fargs):
+        if args.outdir:
+            with open(os.path.join(args.outdir, name + ".out"), "w") as f:
+                f.write(answers)
+        else:
+            sys.stdout.write(answers)
+            sys.stdout.flush()
@@ -0,0 +1,178 @@
+##
+# A TCP server keeping one OnlineTaskScheduler per named session, so that
+# clients no longer need a tasksched_fast.py process per request.
+#
+# The protocol is line based. Every command gets exactly one reply line, in
+# the order the commands were sent:
+#
+#   SESSION name   switch this connection to session ''name'' (created on
+#                  first use; connections start in "default")  => OK
+#   ADD D M        add a task with deadline D and duration M    => id maxover
+#   REMOVE id      cancel the task with id ''id''               => maxover
+#   QUERY                                                       => maxover
+#
+# and anything invalid is answered with "ERR message". A maxover reply is the
+# max overshoot of the session right after that command, as if the commands
+# were applied one by one in the order sent (so a QUERY sees the commands
+# before it, not those after it). They are not applied as they arrive though:
+# all the commands the event loop reads in one pass over the sockets are
+# queued per session, then each session's queue goes to
+# OnlineTaskScheduler.apply_ops: a short queue is applied command by command,
+# a long one as a single batch whose replies are worked out from the tree
+# before it.
+#
+# Python 2 has no asyncio; the loop is the standard library's asyncore, and a
+# pass of asyncore.loop(count=1) is the event-loop tick.
+#
+import asynchat
+import asyncore
+import socket
+
+import tasksched_fast
+
+PORT = 7878
+
+class Session(object):
+    ''' A named scheduler and the commands queued for it this tick. '''
+    def __init__(self, name, max_deadline):
+        self.name = name
+        self.sched = tasksched_fast.OnlineTaskScheduler(max_deadline)
+        self.next_id = 1
+        self.pending = []  # [(kind, op argument, reply slot)]
+        self.adding = set()  # ids of the tasks queued to be added this tick
+        self.removing = set()  # ids of the tasks queued for removal this tick
+
+    def queue_add(self, di, mi, slot):
+        self.sched._check_deadline(di)
+        if mi < 0:
+            raise ValueError("negative duration %d" % mi)
+        tid = self.next_id
+        self.next_id += 1
+        self.adding.add(tid)
+        self.pending.append(("ADD", (tid, di, mi), slot))
+
+    def queue_remove(self, tid, slot):
+        if tid in self.adding:
+            # Added and removed within the same tick: neither reaches the tree.
+            self.adding.remove(tid)
+        elif tid in self.sched and tid not in self.removing:
+            self.removing.add(tid)
+        else:
+            raise ValueError("no task %d" % tid)
+        self.pending.append(("REMOVE", tid, slot))
+
+    def queue_query(self, slot):
+        self.pending.append(("QUERY", None, slot))
+
+    def flush(self):
+        ''' Apply the queued commands as one batch and fill in their replies. '''
+        answers = self.sched.apply_ops([(kind, arg) for kind, arg, slot in self.pending])
+        for (kind, arg, slot), maxover in zip(self.pending, answers):
+            if kind == "ADD":
+                slot[0] = "%d %d\n" % (arg[0], maxover)
+            else:
+                slot[0] = "%d\n" % maxover
+        self.pending = []
+        self.adding = set()
+        self.removing = set()
+
+
+class Connection(asynchat.async_chat):
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock, map=server.map)
+        self.set_terminator("\n")
+        self.server = server
+        self.session = server.session("default")
+        self.inbuf = []
+        self.replies = []  # reply slots in command order, filled by the tick
+
+    def collect_incoming_data(self, data):
+        self.inbuf.append(data)
+
+    def found_terminator(self):
+        line = "".join(self.inbuf)
+        self.inbuf = []
+        slot = [None]
+        self.replies.append(slot)
+        self.server.pending.add(self)
+        try:
+            self.command(line.split(), slot)
+        except ValueError as e:
+            slot[0] = "ERR %s\n" % e
+
+    def command(self, words, slot):
+        cmd = words[0].upper() if words else ""
+        args = map(int, words[1:]) if cmd != "SESSION" else words[1:]
+        if cmd == "ADD" and len(args) == 2:
+            self.session.queue_add(args[0], args[1], slot)
+        elif cmd == "REMOVE" and len(args) == 1:
+            self.session.queue_remove(args[0], slot)
+        elif cmd == "QUERY" and not args:
+            self.session.queue_query(slot)
+        elif cmd == "SESSION" and len(args) == 1:
+            self.session = self.server.session(args[0])
+            slot[0] = "OK\n"
+        else:
+            raise ValueError("bad command %r" % " ".join(words))
+        if slot[0] is None:
+            self.server.dirty.add(self.session)
+
+    def handle_close(self):
+        self.server.pending.discard(self)
+        self.close()
+
+    def send_replies(self):
+        self.push("".join(slot[0] for slot in self.replies))
+        self.replies = []
+
+
+class TaskSchedServer(asyncore.dispatcher):
+    def __init__(self, host="127.0.0.1", port=PORT, max_deadline=tasksched_fast.MAX_DEADLINE):
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.max_deadline = max_deadline
+        self.sessions = {}
+        self.dirty = set()  # sessions with queued commands
+        self.pending = set()  # connections waiting for replies
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(128)
+
+    def session(self, name):
+        if name not in self.sessions:
+            self.sessions[name] = Session(name, self.max_deadline)
+        return self.sessions[name]
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            Connection(pair[0], self)
+
+    def tick(self, timeout=1.0):
+        ''' Run one pass of the event loop, then apply the batches. '''
+        asyncore.loop(timeout, map=self.map, count=1)
+        for session in self.dirty:
+            session.flush()
+        self.dirty.clear()
+        for conn in self.pending:
+            conn.send_replies()
+        self.pending.clear()
+
+    def serve_forever(self):
+        while True:
+            self.tick()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve online task schedulers over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-deadline", type=int, default=tasksched_fast.MAX_DEADLINE)
+    args = parser.parse_args()
+    server = TaskSchedServer(args.host, args.port, args.max_deadline)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -6,17 +6,102 @@
 #
 
 import random
+import struct
+from array import array
 
-def test_case(ntasks):
-    max_mi = 1000
-    max_di = 100000
-    mi = [i for i in range(1, max_mi + 1)]
-    di = [i for i in range(1, max_di + 1)]
+import taskfile
+
+max_mi = 1000
+max_di = 100000
+
+##
+# Deadline distributions for generated cases. "adversarial" alternates between
+# the earliest and the latest deadlines, so consecutive inserts land at both
+# ends of the rank order and walk full-depth paths on both sides of the trees.
+#
+DISTRIBUTIONS = ("uniform", "equal", "sorted", "reverse", "adversarial")
+
+def gen_tasks(ntasks, dist="uniform", seed=None):
+    ''' Generate ''ntasks'' tasks with deadlines drawn from ''dist''. Returns
+    (deadlines, durations) lists; the same ''seed'' gives the same case. '''
+    rng = random.Random(seed)
+    durations = [rng.randint(1, max_mi) for i in xrange(ntasks)]
+    if dist == "uniform":
+        deadlines = [rng.randint(1, max_di) for i in xrange(ntasks)]
+    elif dist == "equal":
+        deadlines = ntasks * [rng.randint(1, max_di)]
+    elif dist == "sorted":
+        deadlines = sorted(rng.randint(1, max_di) for i in xrange(ntasks))
+    elif dist == "reverse":
+        deadlines = sorted((rng.randint(1, max_di) for i in xrange(ntasks)), reverse=True)
+    elif dist == "adversarial":
+        deadlines = [(i / 2 % max_di) + 1 if i % 2 == 0 else max_di - (i / 2 % max_di)
+                     for i in xrange(ntasks)]
+    else:
+        raise ValueError("unknown distribution %s" % dist)
+    return deadlines, durations
+
+def format_case(deadlines, durations):
+    ''' The text input for a case: the number of tasks, then "Di Mi" lines. '''
+    lines = [str(len(deadlines))]
+    lines.extend("%d %d" % (di, mi) for di, mi in zip(deadlines, durations))
+    return "\n".join(lines) + "\n"
+
+def gen_task_file(path, ntasks, dist="uniform", seed=None, chunk=taskfile.CHUNK):
+    ''' Write the case gen_tasks(ntasks, dist, seed) would generate to the
+    task file ''path'' (see taskfile.py), ''chunk'' tasks at a time, so that
+    cases far larger than memory can be made. The durations are drawn first,
+    as in gen_tasks, and the sorted distributions are expanded from a count
+    of each deadline. '''
+    rng = random.Random(seed)
+    dl_off, du_off = taskfile.column_offsets(ntasks)
+    with open(path, "wb") as f:
+        f.write(struct.pack(taskfile.HEADER, taskfile.MAGIC, ntasks))
+        f.seek(du_off)
+        for lo in xrange(0, ntasks, chunk):
+            hi = min(lo + chunk, ntasks)
+            array('i', [rng.randint(1, max_mi) for i in xrange(lo, hi)]).tofile(f)
+        f.seek(dl_off)
+        if dist in ("sorted", "reverse"):
+            counts = array('l', [0]) * (max_di + 1)
+            for i in xrange(ntasks):
+                counts[rng.randint(1, max_di)] += 1
+            order = xrange(1, max_di + 1) if dist == "sorted" else xrange(max_di, 0, -1)
+            for di in order:
+                for lo in xrange(0, counts[di], chunk):
+                    (array('i', [di]) * min(chunk, counts[di] - lo)).tofile(f)
+        else:
+            if dist == "equal" and ntasks:
+                di = rng.randint(1, max_di)
+            for lo in xrange(0, ntasks, chunk):
+                hi = min(lo + chunk, ntasks)
+                if dist == "uniform":
+                    col = array('i', [rng.randint(1, max_di) for i in xrange(lo, hi)])
+                elif dist == "equal":
+                    col = array('i', [di]) * (hi - lo)
+                elif dist == "adversarial":
+                    col = array('i', [(i / 2 % max_di) + 1 if i % 2 == 0 else
+                                      max_di - (i / 2 % max_di) for i in xrange(lo, hi)])
+                else:
+                    raise ValueError("unknown distribution %s" % dist)
+                col.tofile(f)
+        f.truncate(du_off + ntasks * taskfile.ITEM_SIZE)
+
+def test_case(ntasks, dist="uniform", seed=None):
+    deadlines, durations = gen_tasks(ntasks, dist, seed)
     print ntasks
-    for i in xrange(ntasks):
-        mi = random.randint(1, max_mi)
-        di = random.randint(1, max_di)
+    for di, mi in zip(deadlines, durations):
         print di, mi
 
-ntasks = int(raw_input())
-test_case(ntasks)
+
+if __name__ == "__main__":
+    import sys
+    # Optional arguments: distribution, seed and a task file to write the case
+    # to instead of printing it, e.g. "uniform 42 case.bin".
+    dist = sys.argv[1] if len(sys.argv) > 1 else "uniform"
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    ntasks = int(raw_input())
+    if len(sys.argv) > 3:
+        gen_task_file(sys.argv[3], ntasks, dist, seed)
+    else:
+        test_case(ntasks, dist, seed)